@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Data files needed to run the greeter from the source tree
+
+The package installs language_codes and the keyboard layout index at
+build and installation time; when they are not installed, use_data()
+generates them the same way in a temporary directory, and points
+tailsgreeter.config at them.
+"""
+
+import os
+import re
+import tempfile
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+SUPPORTED_LOCALES = '/usr/share/i18n/SUPPORTED'
+
+def write_language_codes(path, supported=SUPPORTED_LOCALES):
+    """Write the locale codes of supported, like debian/rules does"""
+    codes = []
+    with open(supported) as f:
+        for line in f:
+            if '_' not in line or '@' in line:
+                continue
+            match = re.match(r'(.*?)[. ]', line)
+            if match and (not codes or codes[-1] != match.group(1)):
+                codes.append(match.group(1))
+    with open(path, 'w') as f:
+        f.write(''.join(code + '\n' for code in codes))
+
+def use_data(directory=None):
+    """Make tailsgreeter.config point to usable data files
+
+    Returns the directory holding the generated files."""
+    import tailsgreeter.config
+    import tailsgreeter.xkbindex
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='tails-greeter-data-')
+    config = tailsgreeter.config
+    if not os.path.exists(config.default_langcodes_path):
+        config.default_langcodes_path = os.path.join(SOURCE_DIR,
+                                                     'default_langcodes')
+    if not os.path.exists(config.language_codes_path):
+        config.language_codes_path = os.path.join(directory, 'language_codes')
+        write_language_codes(config.language_codes_path)
+    if tailsgreeter.xkbindex.load_index() is None:
+        config.xkb_index_path = os.path.join(directory, 'xkb_index.json')
+        tailsgreeter.xkbindex.write_index(
+            tailsgreeter.xkbindex.build_index(config.xkb_rules_path),
+            config.xkb_index_path)
+    os.environ.setdefault('TAILS_GREETER_FAKE_XKB_INDEX', config.xkb_index_path)
+    return directory
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Startup and login latency of the greeter, with fake backends
+
+Runs the greeter against the in-process fakes of GDM, AccountsService
+and Xkl (see tailsgreeter.fakebackends, whose delays can be set through
+the environment), logs in as soon as the UI is ready, and reports:
+- startup: from the process start to the UI being ready;
+- login: from requesting login to GDM opening the session.
+
+By default the whole CommunityGreeterApp is run, which needs an X
+display, e.g. under xvfb-run. With --headless, only the models are run,
+without any window.
+
+Usage (from the source tree):
+    xvfb-run python benchmarks/greeter.py [--runs N]
+    python benchmarks/greeter.py --headless [--runs N]
+"""
+
+import argparse
+import imp
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Must be set before tailsgreeter.config is imported
+os.environ['TAILS_GREETER_FAKE_BACKENDS'] = '1'
+sys.path.insert(0, SOURCE_DIR)
+
+import tailsgreeter.config
+import tailsgreeter.timeline
+from tailsgreeter.timeline import monotonic
+
+import data
+
+def run_app(settings_path):
+    """Run the whole greeter, return (startup, login) latencies"""
+    from gi.repository import GObject, Gtk
+    GObject.threads_init()
+    greeter = imp.load_source('tails_greeter',
+                              os.path.join(SOURCE_DIR, 'tails-greeter.py'))
+    tailsgreeter.config.session_settings_path = settings_path
+    times = {}
+    app = greeter.CommunityGreeterApp()
+    maybe_show_ui = app.maybe_show_ui
+
+    def login_when_ready():
+        maybe_show_ui()
+        if app.ready and 'ready' not in times:
+            times['ready'] = monotonic()
+            app.login()
+    app.maybe_show_ui = login_when_ready
+    Gtk.main()
+    return (times['ready'] - tailsgreeter.timeline.startup.start,
+            monotonic() - times['ready'])
+
+def run_models(settings_path):
+    """Run the greeter models only, return (startup, login) latencies"""
+    from gi.repository import GLib
+    import tailsgreeter.gdmclient
+    import tailsgreeter.language
+    import tailsgreeter.settings
+
+    loop = GLib.MainLoop()
+    times = {}
+    settings = tailsgreeter.settings.SettingsStore(settings_path)
+
+    def maybe_login():
+        if 'gdm' in times and 'users' in times:
+            times['ready'] = monotonic()
+            localisation.set_locale('en_US')
+            localisation.set_layout('us')
+            settings.commit()
+            gdmclient.do_login(tailsgreeter.config.LUSER)
+
+    def server_ready():
+        times['gdm'] = monotonic()
+        maybe_login()
+
+    def usermanager_loaded():
+        times['users'] = monotonic()
+        maybe_login()
+
+    gdmclient = tailsgreeter.gdmclient.GdmClient(
+        server_ready_cb=server_ready, session_opened_cb=loop.quit)
+    localisation = tailsgreeter.language.LocalisationSettings(
+        settings, usermanager_loaded_cb=usermanager_loaded)
+    loop.run()
+    return (times['ready'] - tailsgreeter.timeline.startup.start,
+            monotonic() - times['ready'])
+
+def run_once(args):
+    """Run the greeter in this process and print its latencies as JSON"""
+    os.chdir(SOURCE_DIR)
+    directory = data.use_data()
+    try:
+        settings_path = os.path.join(directory, 'tails.session')
+        if args.headless:
+            startup, login = run_models(settings_path)
+        else:
+            startup, login = run_app(settings_path)
+    finally:
+        shutil.rmtree(directory)
+    print json.dumps({'startup': startup, 'login': login})
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--headless', action='store_true',
+                        help='run the models only, without any window')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='how many times to start the greeter')
+    parser.add_argument('--once', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv[1:])
+    if args.once:
+        run_once(args)
+        return 0
+
+    # each run is a new process, so that startup is measured from scratch
+    command = [sys.executable, os.path.abspath(__file__), '--once']
+    if args.headless:
+        command.append('--headless')
+    results = []
+    for i in range(args.runs):
+        output = subprocess.check_output(command)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print '%-10s %10s %10s %10s' % ('', 'min', 'median', 'max')
+    for name in ('startup', 'login'):
+        values = sorted(result[name] for result in results)
+        print '%-10s %8.3f s %8.3f s %8.3f s' % (
+            name, values[0], values[len(values) // 2], values[-1])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Benchmarks of the tailsgreeter.language hot paths
+
+Times, on the full list of language codes, the complete keyboard layout
+registry and every locale of default_langcodes:
+- languages_from_locales and countries_from_locales;
+- languages_with_names and sort_by_name, in every default locale;
+- LocalisationSettings.layouts_for_language, for every language, and
+  building its locales dictionary;
+- the set_language, set_locale, set_layout chain, for every default
+  locale (not including the activation of the layout, which happens
+  later in the main loop).
+
+Each benchmark is timed once after language.invalidate() (cold), then as
+the best of several runs (warm). Each warm run calls it enough times to
+last at least MIN_RUN_TIME, so that timer noise does not dominate the
+sub-millisecond benchmarks. Results can be saved as JSON, and compared
+with a baseline saved earlier on the same machine:
+
+    python benchmarks/language.py --save-baseline
+    (change tailsgreeter/language.py)
+    python benchmarks/language.py
+
+The exit status is 1 if a benchmark got slower than the baseline by more
+than the threshold. Xkl and AccountsService are replaced by the fakes
+from tailsgreeter.fakebackends, so no display is needed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import timeit
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Must be set before tailsgreeter.config is imported
+os.environ['TAILS_GREETER_FAKE_BACKENDS'] = '1'
+sys.path.insert(0, SOURCE_DIR)
+
+import tailsgreeter.config
+import tailsgreeter.language as language
+import tailsgreeter.settings
+
+import data
+
+# Bump when benchmarks are added or changed, so that results are only
+# compared with baselines measuring the same thing
+SUITE_VERSION = 2
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'language-baseline.json')
+REPEAT = 7
+MIN_RUN_TIME = 0.2 # seconds
+
+def calls_per_run(timer):
+    """Return how many calls make a run last at least MIN_RUN_TIME"""
+    number = 1
+    while timer.timeit(number=number) < MIN_RUN_TIME:
+        number *= 10
+    return number
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def benchmarks():
+    """Return the list of (name, function) to time"""
+    langcodes = language.get_langcodes()
+    default_locales = read_lines(tailsgreeter.config.default_langcodes_path)
+    languages = language.languages_from_locales(langcodes)
+    layouts = language.get_system_layouts().keys()
+    settings = language.LocalisationSettings(
+        tailsgreeter.settings.SettingsStore(os.devnull))
+    fill_locales_dict = settings._LocalisationSettings__fill_locales_dict
+
+    def languages_with_names():
+        for locale in default_locales:
+            language.languages_with_names(languages, locale)
+
+    def sort_by_name():
+        entries = [(l, language.layout_name(l)) for l in layouts]
+        for locale in default_locales:
+            language.sort_by_name(list(entries), locale)
+
+    def layouts_for_language():
+        for code in languages:
+            settings._language = code
+            settings.layouts_for_language()
+
+    def language_chain():
+        for locale in default_locales:
+            settings.set_language(language.language_from_locale(locale))
+            settings.set_locale(locale)
+            settings.set_layout(settings.get_layout())
+
+    return [
+        ('languages_from_locales',
+         lambda: language.languages_from_locales(langcodes)),
+        ('countries_from_locales',
+         lambda: language.countries_from_locales(langcodes)),
+        ('languages_with_names', languages_with_names),
+        ('sort_by_name', sort_by_name),
+        ('layouts_for_language', layouts_for_language),
+        ('fill_locales_dict', lambda: fill_locales_dict(langcodes)),
+        ('set_language_chain', language_chain),
+        ]
+
+def run():
+    """Run the benchmarks, return the results as a dictionary"""
+    results = {}
+    for name, function in benchmarks():
+        language.invalidate()
+        timer = timeit.Timer(function)
+        cold = timer.timeit(number=1)
+        number = calls_per_run(timer)
+        warm = min(timer.repeat(repeat=REPEAT, number=number)) / number
+        results[name] = {'cold': cold, 'warm': warm}
+    return {
+        'version': SUITE_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results': results,
+        }
+
+def compare(current, baseline, threshold):
+    """Print current results next to the baseline ones
+
+    Returns the names of the benchmarks slower than baseline * threshold."""
+    regressions = []
+    print '%-24s %12s %12s %12s %12s' % (
+        'benchmark', 'cold', 'warm', 'base warm', 'ratio')
+    for name in sorted(current['results']):
+        result = current['results'][name]
+        base = baseline['results'].get(name) if baseline else None
+        if base:
+            ratio = result['warm'] / base['warm']
+            flag = ''
+            if ratio > threshold:
+                regressions.append(name)
+                flag = ' slower'
+            print '%-24s %9.3f ms %9.3f ms %9.3f ms %11.2fx%s' % (
+                name, result['cold'] * 1000, result['warm'] * 1000,
+                base['warm'] * 1000, ratio, flag)
+        else:
+            print '%-24s %9.3f ms %9.3f ms %12s %12s' % (
+                name, result['cold'] * 1000, result['warm'] * 1000, '-', '-')
+    return regressions
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except IOError:
+        return None
+    if baseline.get('version') != SUITE_VERSION:
+        print >> sys.stderr, 'ignoring baseline %s: suite version %s, expected %s' % (
+            path, baseline.get('version'), SUITE_VERSION)
+        return None
+    return baseline
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--output',
+                        help='save the results as JSON to this file')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='warm time ratio above which a benchmark '
+                             'counts as slower (default: %(default)s)')
+    args = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.ERROR)
+    directory = data.use_data()
+    try:
+        current = run()
+    finally:
+        shutil.rmtree(directory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print 'saved baseline to %s' % args.baseline
+        baseline = None
+    else:
+        baseline = load_baseline(args.baseline)
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print 'slower than baseline: %s' % ', '.join(regressions)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
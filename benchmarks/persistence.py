@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Persistence activation latency, on a plain Linux box
+
+Runs PersistenceSettings against the fake sudo, cryptsetup and
+live-persist from tools/fake-backends, and measures for a few scenarios:
+- the end-to-end latency of activate();
+- how long the main loop is blocked while activate_async() runs, by
+  checking how late a 10 ms heartbeat timer fires.
+
+Usage (from the source tree, not as root, since the helper only accepts
+replacement tools when not running as root):
+    python benchmarks/persistence.py
+"""
+
+import os
+import sys
+import time
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+FAKE_BACKENDS_DIR = os.path.join(SOURCE_DIR, 'tools', 'fake-backends')
+
+os.environ['PYTHONPATH'] = SOURCE_DIR
+sys.path.insert(0, SOURCE_DIR)
+
+from gi.repository import GLib
+
+import tailsgreeter.errors
+import tailsgreeter.helper
+import tailsgreeter.persistence
+import tailsgreeter.settings
+
+FAST = {
+    'FAKE_UNLOCK_DELAY': '0.5',
+    'FAKE_LIST_DELAY': '0.2',
+    'FAKE_MOUNT_DELAY': '0.2',
+    'FAKE_CONTAINERS': '/dev/sdb2',
+    }
+
+# name, fake backends settings, passphrase
+SCENARIOS = [
+    ('one container', {}, 'passphrase'),
+    ('wrong passphrase', {}, 'wrong'),
+    ('slow mount', { 'FAKE_MOUNT_DELAY': '2' }, 'passphrase'),
+    ('three containers',
+     { 'FAKE_CONTAINERS': '/dev/sdb2 /dev/sdc2 /dev/sdd2' }, 'passphrase'),
+    ]
+
+HEARTBEAT_INTERVAL = 10 # ms
+
+# The helper, run through the fake sudo, with the fake tools
+HELPER_COMMAND = [
+    os.path.join(FAKE_BACKENDS_DIR, 'sudo'), '-n', sys.executable,
+    os.path.join(SOURCE_DIR, 'tails-greeter-helper.py'),
+    '--cryptsetup=%s' % os.path.join(FAKE_BACKENDS_DIR, 'cryptsetup'),
+    '--live-persist=%s' % os.path.join(FAKE_BACKENDS_DIR, 'live-persist'),
+    '--live-persist-log=%s' % os.devnull,
+    ]
+
+def measure_activate(persistence, devices, passphrase):
+    start = time.time()
+    try:
+        persistence.activate(devices, passphrase, readonly=False)
+        outcome = 'ok'
+    except tailsgreeter.errors.TailsGreeterError as e:
+        outcome = e.__class__.__name__
+    return time.time() - start, outcome
+
+def measure_blocking(persistence, devices, passphrase):
+    """Return the worst heartbeat delay while activate_async() runs"""
+    loop = GLib.MainLoop()
+    state = { 'last': time.time(), 'worst': 0.0 }
+
+    def heartbeat():
+        now = time.time()
+        late = now - state['last'] - HEARTBEAT_INTERVAL / 1000.0
+        state['worst'] = max(state['worst'], late)
+        state['last'] = now
+        return True
+
+    def done(*args):
+        loop.quit()
+
+    heartbeat_id = GLib.timeout_add(HEARTBEAT_INTERVAL, heartbeat)
+    persistence.activate_async(devices, passphrase, False,
+                               callback=done, errback=done)
+    loop.run()
+    GLib.source_remove(heartbeat_id)
+    return state['worst']
+
+def run_scenario(name, settings, passphrase):
+    for key, value in FAST.items():
+        os.environ[key] = settings.get(key, value)
+    helper = tailsgreeter.helper.HelperClient(HELPER_COMMAND)
+    persistence = tailsgreeter.persistence.PersistenceSettings(
+        tailsgreeter.settings.SettingsStore(), helper)
+    try:
+        start = time.time()
+        devices = persistence.list_containers()
+        list_latency = time.time() - start
+        latency, outcome = measure_activate(persistence, devices, passphrase)
+        worst_block = measure_blocking(persistence, devices, passphrase)
+    finally:
+        helper.stop()
+    print '%-20s %8.3f s %8.3f s %10.1f ms  %s' % (
+        name, list_latency, latency, worst_block * 1000, outcome)
+
+def main(argv):
+    try:
+        GLib.threads_init()
+    except AttributeError:
+        pass
+    print '%-20s %10s %10s %13s  %s' % (
+        'scenario', 'list', 'activate', 'main loop', 'outcome')
+    for name, settings, passphrase in SCENARIOS:
+        run_scenario(name, settings, passphrase)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Cost of sorting the full list of keyboard layouts
+
+Compares the former sort_by_name() implementation, which created a
+collator and computed every collation key on each call, with the current
+one, with cold and warm caches.
+
+Usage (from the source tree): python benchmarks/sort_by_name.py [INDEX]
+where INDEX is a keyboard layout index built by tailsgreeter.xkbindex.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import icu
+
+import tailsgreeter.config
+import tailsgreeter.language as language
+
+LOCALES = ['en_US', 'fr_FR', 'de_DE', 'ru_RU', 'zh_CN']
+REPEAT = 5
+NUMBER = 10
+
+def former_sort_by_name(list, locale='C'):
+    try:
+        collator = icu.Collator.createInstance(icu.Locale(locale))
+    except:
+        collator = None
+    def compare_choice(elt):
+        if collator:
+            try:
+                return collator.getCollationKey(elt[1]).getByteArray()
+            except:
+                return elt[1]
+    list.sort(key=compare_choice)
+    return list
+
+def layouts_with_names():
+    layouts = language.get_system_layouts()
+    return [(l, language.layout_name(l)) for l in layouts.keys()]
+
+def clear_caches():
+    language._collators.clear()
+    language._sort_keys.clear()
+
+def measure(name, stmt, setup=None):
+    if setup is None:
+        setup = lambda: None
+    timer = timeit.Timer(stmt, setup)
+    best = min(timer.repeat(repeat=REPEAT, number=NUMBER)) / NUMBER
+    print '%-40s %8.3f ms' % (name, best * 1000)
+    return best
+
+def main(argv):
+    if len(argv) > 1:
+        tailsgreeter.config.xkb_index_path = argv[1]
+    entries = layouts_with_names()
+    print 'sorting %d layouts in %d locales' % (len(entries), len(LOCALES))
+
+    def sort_with(sort_function):
+        for locale in LOCALES:
+            sort_function(list(entries), locale)
+
+    before = measure('former sort_by_name',
+                     lambda: sort_with(former_sort_by_name))
+    cold = measure('sort_by_name, cold caches',
+                   lambda: (clear_caches(), sort_with(language.sort_by_name)))
+    sort_with(language.sort_by_name)
+    warm = measure('sort_by_name, warm caches',
+                   lambda: sort_with(language.sort_by_name))
+    print 'speedup: %.1fx cold, %.1fx warm' % (before / cold, before / warm)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
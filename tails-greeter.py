@@ -21,10 +21,17 @@
 GDM greeter for Tails project using gtk
 """
 
+import tailsgreeter.timeline
+tailsgreeter.timeline.startup.mark('python started')
+import tailsgreeter.profiling
+tailsgreeter.profiling.start()
+
 import logging, logging.config
-from gi.repository import Gtk
+from gi.repository import GObject, Gtk
+tailsgreeter.timeline.startup.mark('gtk imported')
 import sys, os
 import tailsgreeter.gdmclient
+tailsgreeter.timeline.startup.mark('gdm imported')
 
 def print_log_record_on_error(func):
     """Wrapper to determine failed logging instance"""
@@ -43,16 +50,20 @@ logging.LogRecord.getMessage = print_log_record_on_error(logging.LogRecord.getMe
 from pipes import quote
 
 import tailsgreeter.config
+import tailsgreeter.login
 import tailsgreeter.rootaccess
 import tailsgreeter.camouflage
 import tailsgreeter.persistence
 import tailsgreeter.physicalsecurity
+import tailsgreeter.settings
+import tailsgreeter.tracing
 
 from tailsgreeter.language import TranslatableWindow
 from tailsgreeter.langpanel import LangPanel
 from tailsgreeter.persistencewindow import PersistenceWindow
 from tailsgreeter.optionswindow import OptionsWindow
 from tailsgreeter import GLADE_DIR, __appname__
+tailsgreeter.timeline.startup.mark('greeter modules imported')
 
 class CommunityGreeterApp():
     """Tails greeter main controller
@@ -75,18 +86,34 @@ class CommunityGreeterApp():
         self._loaded_windows = []
         
         # Load models
+        # Settings for the upcoming session, written when login starts
+        self.settings = tailsgreeter.settings.SettingsStore()
+        # Start probing for persistence containers first, so that it runs
+        # in parallel with the GDM and AccountsService handshakes
+        self.persistence = tailsgreeter.persistence.PersistenceSettings(
+            self.settings)
+        if tailsgreeter.config.tails_specific:
+            self.persistence.watch_containers(self.containers_changed)
+        tailsgreeter.timeline.startup.mark('persistence discovery started')
         self.gdmclient = tailsgreeter.gdmclient.GdmClient(
             server_ready_cb=self.server_ready,
             session_opened_cb = self.close_app
         )
-        self.persistence = tailsgreeter.persistence.PersistenceSettings()
+        tailsgreeter.timeline.startup.mark('gdm connected')
         self.localisationsettings = tailsgreeter.language.LocalisationSettings(
+            self.settings,
             usermanager_loaded_cb = self.usermanager_loaded,
             locale_selected_cb = self.locale_selected
         )
-        self.rootaccess = tailsgreeter.rootaccess.RootAccessSettings()
-        self.camouflage = tailsgreeter.camouflage.CamouflageSettings()
-        self.physical_security = tailsgreeter.physicalsecurity.PhysicalSecuritySettings()
+        tailsgreeter.timeline.startup.mark('localisation settings loaded')
+        self.rootaccess = tailsgreeter.rootaccess.RootAccessSettings(
+            self.settings)
+        self.camouflage = tailsgreeter.camouflage.CamouflageSettings(
+            self.settings)
+        self.physical_security = tailsgreeter.physicalsecurity.PhysicalSecuritySettings(
+            self.settings)
+        self.login_pipeline = tailsgreeter.login.LoginPipeline(self)
+        tailsgreeter.timeline.startup.mark('models loaded')
 
         # Load views
         self.langpanel = self.load_window(LangPanel, self)
@@ -98,11 +125,14 @@ class CommunityGreeterApp():
     def load_window(self, window_class, *args, **kwargs):
         """When loading a window, also translate it"""
         logging.debug("loading window %s" % window_class)
-        window = window_class(*args, **kwargs)
-        self._loaded_windows.append(window)
-        if isinstance(window, TranslatableWindow) and self.language:
-            logging.debug("found translatable window")
-            window.translate_to(self.language.split('_')[0])
+        with tailsgreeter.tracing.span('load_window',
+                                       window=window_class.__name__):
+            window = window_class(*args, **kwargs)
+            self._loaded_windows.append(window)
+            if isinstance(window, TranslatableWindow) and self.language:
+                logging.debug("found translatable window")
+                window.translate_to(self.language.split('_')[0])
+        tailsgreeter.timeline.startup.mark('%s loaded' % window_class.__name__)
         return window
 
     def translate_to(self, lang):
@@ -115,13 +145,15 @@ class CommunityGreeterApp():
                 logging.debug("translating %s to %s" % (window, lang))
                 window.translate_to(lang)
 
-    def login(self):
-        """Login GDM to the server"""
-        self.gdmclient.do_login(tailsgreeter.config.LUSER)
+    def login(self, validate=None, persist=None, working=None):
+        """Login GDM to the server, once persistence is activated and the
+        settings are written; see LoginPipeline.start()"""
+        return self.login_pipeline.start(validate, persist, working)
 
     def server_ready(self):
         """Server is ready"""
         logging.debug("Entering server_ready")
+        tailsgreeter.timeline.startup.mark('gdm ready')
         self._gdmserver_ready = True
         self.localisationsettings.set_layout('us')
         self.maybe_show_ui()
@@ -129,10 +161,15 @@ class CommunityGreeterApp():
     def usermanager_loaded(self):
         """UserManager is ready"""
         logging.debug("Entering usermanager_loaded")
+        tailsgreeter.timeline.startup.mark('user manager loaded')
         self._usermanager_ready = True
         self.localisationsettings.set_locale('en_US')
         self.maybe_show_ui()
 
+    def containers_changed(self, containers):
+        """Persistence containers were discovered"""
+        self.persistencewindow.set_containers(containers)
+
     def locale_selected(self, locale):
         self.translate_to(locale)
 
@@ -140,20 +177,29 @@ class CommunityGreeterApp():
         """Show UI if server and usermanager are both ready"""
         logging.debug("Entering maybe_show_ui")
         if self._gdmserver_ready and self._usermanager_ready:
+            first_time = not self.ready
             self.ready = True
             logging.info("tails-greeter is ready.")
             self.langpanel.window.show()
             self.persistencewindow.window.show()
+            if first_time:
+                tailsgreeter.timeline.startup.mark('ui shown')
+                tailsgreeter.timeline.startup.emit(
+                    tailsgreeter.config.startup_timeline_path)
         else:
             logging.debug("Something is not ready; not showing UI yet")
 
     def close_app(self):
         """We're done, quit gtk app"""
         logging.info("Finished.")
+        tailsgreeter.profiling.dump()
         Gtk.main_quit()
 
 if __name__ == "__main__":
     logging.info("Started.")
+    # persistence is activated from worker threads
+    GObject.threads_init()
     app = CommunityGreeterApp()
+    tailsgreeter.timeline.startup.mark('main loop started')
     Gtk.main()
 
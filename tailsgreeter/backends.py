@@ -0,0 +1,74 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""System services used by the greeter
+
+The greeter gets its GDM, AccountsService and Xkl objects from here.
+With TAILS_GREETER_FAKE_BACKENDS=1, they are replaced by the in-process
+fakes from tailsgreeter.fakebackends, so that the greeter can run without
+GDM, AccountsService or a real X keyboard. The libraries are imported on
+first use, so the fakes do not need them installed.
+"""
+
+import tailsgreeter.config
+
+def _fakes():
+    import tailsgreeter.fakebackends
+    return tailsgreeter.fakebackends
+
+def greeter_client():
+    """Return a new GdmGreeter.Client"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().GreeterClient()
+    from gi.repository import GdmGreeter
+    return GdmGreeter.Client()
+
+def user_manager():
+    """Return the AccountsService.UserManager"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().UserManager.get_default()
+    from gi.repository import AccountsService
+    return AccountsService.UserManager.get_default()
+
+def xkl_engine():
+    """Return the Xkl.Engine of the default display"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().XklEngine.get_instance()
+    from gi.repository import GdkX11
+    from gi.repository import Xkl
+    return Xkl.Engine.get_instance(GdkX11.x11_get_default_xdisplay())
+
+def xkl_config_rec():
+    """Return a new Xkl.ConfigRec"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().XklConfigRec()
+    from gi.repository import Xkl
+    return Xkl.ConfigRec()
+
+def xkl_config_registry(engine):
+    """Return the Xkl.ConfigRegistry of engine, not loaded yet"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().XklConfigRegistry.get_instance(engine)
+    from gi.repository import Xkl
+    return Xkl.ConfigRegistry.get_instance(engine)
+
+def xkl_track_keyboard_state():
+    """Return the Xkl.EngineListenModes value tracking the keyboard state"""
+    if tailsgreeter.config.fake_backends:
+        return _fakes().XklEngine.TRACK_KEYBOARD_STATE
+    from gi.repository import Xkl
+    return Xkl.EngineListenModes.TRACK_KEYBOARD_STATE
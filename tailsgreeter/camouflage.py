@@ -18,17 +18,13 @@
 """Camouflage handling
 
 """
-import os
-import logging
-import pipes
-
-import tailsgreeter.config
 
 class CamouflageSettings(object):
     """Model storing settings related to camouflage
 
     """
-    def __init__(self):
+    def __init__(self, settings):
+        self.settings = settings
         # Which OS to impersonate
         self.os = None
         # XXX: this should read the content of the setting file
@@ -39,18 +35,9 @@ class CamouflageSettings(object):
 
     @os.setter
     def os(self, new_os):
-        camouflage_settings_file = tailsgreeter.config.camouflage_settings
         self._os = new_os
         if new_os:
-            with open(camouflage_settings_file, 'w') as f:
-                os.chmod(camouflage_settings_file, 0o600)
-                f.write('TAILS_CAMOUFLAGE_OS=%s\n' % pipes.quote(self.os))
-                logging.debug('camouflage setting written to %s',
-                              camouflage_settings_file)
+            variables = [('TAILS_CAMOUFLAGE_OS', new_os)]
         else:
-            try:
-                os.unlink(camouflage_settings_file)
-                logging.debug('removed %s', camouflage_settings_file)
-            except OSError:
-                # configuration file does not exist
-                pass
+            variables = None
+        self.settings.stage('camouflage', variables)
@@ -18,10 +18,16 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>
 #
 
+import os
+
 tails_specific = False # TODO: Depend on a runtime check
 
 """Tails-greeter configuration"""
 
+# Start unlocking persistence as soon as the passphrase is entered, and
+# show the options window meanwhile, instead of waiting for it
+speculative_persistence_unlock = True
+
 # default Tails credentials
 LPASSWORD = 'live'
 if tails_specific:
@@ -42,17 +48,30 @@ locales_path = '/usr/share/locale/'
 default_locales = ["ar_EG", "zh_CN", "en_US", "fa_IR", "fr_FR",
                   "de_DE", "it", "pt", "ru", "es", "vi_VN"]
 
-# file to store tails session locale settings
-locale_output_path = '/var/lib/gdm3/tails.locale'
+# Command starting the privileged helper performing persistence operations
+# (see tailsgreeter.helper)
+persistence_helper_command = ['/usr/bin/sudo', '-n', '/usr/bin/python',
+                              '/usr/share/tails-greeter/tails-greeter-helper.py']
+
+# Settings for the upcoming session, sourced by PostLogin
+session_settings_path = '/var/lib/gdm3/tails.session'
+
+# xkeyboard-config rules file describing the available keyboard layouts
+xkb_rules_path = '/usr/share/X11/xkb/rules/evdev.xml'
+
+# precomputed index of keyboard layouts, built from xkb_rules_path at
+# package installation time (see tailsgreeter.xkbindex)
+xkb_index_path = '/var/cache/tails-greeter/xkb_index.json'
 
-# file to store tails session sudo password to
-rootpassword_output_path = '/var/lib/gdm3/tails.password'
+# where to save the startup timeline, if set (see tailsgreeter.timeline)
+startup_timeline_path = os.environ.get('TAILS_GREETER_TIMELINE')
 
-# File where Tails persistence status is saved
-persistence_state_file = '/var/lib/gdm3/tails.persistence'
+# where to save a trace of startup and login, if set (see tailsgreeter.tracing)
+trace_path = os.environ.get('TAILS_GREETER_TRACE')
 
-# Stores which operating system camouflage to activate, if any
-camouflage_settings = '/var/lib/gdm3/tails.camouflage'
+# where to save CPU and memory profiles, if set (see tailsgreeter.profiling)
+profile_dir = os.environ.get('TAILS_GREETER_PROFILE')
 
-# Stores settings related to physical security
-physical_security_settings = '/var/lib/gdm3/tails.physical_security'
+# use the in-process fakes of GDM, AccountsService and Xkl instead of the
+# real services (see tailsgreeter.backends)
+fake_backends = os.environ.get('TAILS_GREETER_FAKE_BACKENDS') == '1'
@@ -28,6 +28,14 @@ class LivePersistError(TailsGreeterError):
 class WrongPassphraseError(LivePersistError):
     pass
 
+class HelperError(TailsGreeterError):
+    """The privileged helper failed or is not available."""
+    pass
+
+class OperationCancelledError(TailsGreeterError):
+    """The operation was cancelled by the user."""
+    pass
+
 class GdmServerNotReady(TailsGreeterError):
     """Called something that needs GDM server to be ready, which is not the case yet."""
     pass
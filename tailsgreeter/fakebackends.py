@@ -0,0 +1,252 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""In-process fakes of GDM, AccountsService and Xkl
+
+They implement what the greeter uses of GdmGreeter.Client,
+AccountsService.UserManager and the Xkl engine, config record and
+registry, and emit the same signals, after delays set in milliseconds
+through the environment:
+- TAILS_GREETER_FAKE_GDM_READY_DELAY (default 100): from starting the
+  conversation to 'ready';
+- TAILS_GREETER_FAKE_SESSION_DELAY (default 500): from beginning
+  auto-login to 'session-opened';
+- TAILS_GREETER_FAKE_USERS_DELAY (default 200): from getting the user
+  manager to 'notify::is-loaded';
+- TAILS_GREETER_FAKE_XKL_ACTIVATE_DELAY (default 0): how long activating
+  a keyboard layout blocks.
+
+The fake XKB registry is loaded from a keyboard layout index built by
+tailsgreeter.xkbindex, TAILS_GREETER_FAKE_XKB_INDEX or by default the
+installed one.
+
+See tailsgreeter.backends for how to enable them.
+"""
+
+import logging
+import os
+import time
+
+from gi.repository import GLib
+from gi.repository import GObject
+
+import tailsgreeter.config
+import tailsgreeter.xkbindex
+
+def _delay(name, default):
+    return int(os.environ.get('TAILS_GREETER_FAKE_%s_DELAY' % name, default))
+
+GDM_READY_DELAY = _delay('GDM_READY', 100)
+SESSION_DELAY = _delay('SESSION', 500)
+USERS_DELAY = _delay('USERS', 200)
+XKL_ACTIVATE_DELAY = _delay('XKL_ACTIVATE', 0)
+
+def _emit_later(delay, obj, signal, *args):
+    def emit():
+        logging.debug("fake %s emits %s", obj.__class__.__name__, signal)
+        obj.emit(signal, *args)
+        return False
+    GLib.timeout_add(delay, emit)
+
+class GreeterClient(GObject.Object):
+    """Fake GdmGreeter.Client, auto-login only"""
+
+    __gsignals__ = {
+        'ready': (GObject.SignalFlags.RUN_LAST, None, (str,)),
+        'reset': (GObject.SignalFlags.RUN_LAST, None, (str,)),
+        'default-session-changed': (GObject.SignalFlags.RUN_LAST, None, (str,)),
+        'info': (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+        'problem': (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+        'info-query': (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+        'secret-info-query': (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+        'session-opened': (GObject.SignalFlags.RUN_LAST, None, (str,)),
+        'timed-login-requested': (GObject.SignalFlags.RUN_LAST, None, (str, int)),
+        'authentication-failed': (GObject.SignalFlags.RUN_LAST, None, ()),
+        'conversation-stopped': (GObject.SignalFlags.RUN_LAST, None, (str,)),
+        }
+
+    def __init__(self):
+        GObject.Object.__init__(self)
+        self.service_name = None
+
+    def open_connection(self):
+        return True
+
+    def call_disconnect(self):
+        pass
+
+    def call_start_conversation(self, service_name):
+        self.service_name = service_name
+        _emit_later(GDM_READY_DELAY, self, 'ready', service_name)
+
+    def call_begin_auto_login(self, user_name):
+        logging.info("fake GDM: auto-login of %s", user_name)
+        _emit_later(SESSION_DELAY, self, 'session-opened', self.service_name)
+
+    def call_start_session_when_ready(self, service_name, should_start):
+        logging.info("fake GDM: starting session for %s", service_name)
+
+class User(object):
+    """Fake AccountsService.User"""
+
+    def __init__(self, name):
+        self.name = name
+        self.language = None
+
+    def is_loaded(self):
+        return True
+
+    def set_language(self, language):
+        self.language = language
+        logging.debug("fake AccountsService: %s language set to %s",
+                      self.name, language)
+
+class UserManager(GObject.Object):
+    """Fake AccountsService.UserManager"""
+
+    is_loaded = GObject.Property(type=bool, default=False)
+
+    __default = None
+
+    @classmethod
+    def get_default(cls):
+        if cls.__default is None:
+            cls.__default = cls()
+        return cls.__default
+
+    def __init__(self):
+        GObject.Object.__init__(self)
+        self.__users = {}
+        GLib.timeout_add(USERS_DELAY, self.__on_loaded)
+
+    def __on_loaded(self):
+        logging.debug("fake UserManager is loaded")
+        self.is_loaded = True
+        return False
+
+    def get_user(self, name):
+        if name not in self.__users:
+            self.__users[name] = User(name)
+        return self.__users[name]
+
+class XklEngine(object):
+    """Fake Xkl.Engine"""
+
+    TRACK_KEYBOARD_STATE = 1
+
+    __instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self):
+        self.layouts = ['us']
+        self.variants = ['']
+        self.group = 0
+
+    def start_listen(self, mode):
+        pass
+
+    def stop_listen(self, mode):
+        pass
+
+    def lock_group(self, group):
+        self.group = group
+
+class XklConfigRec(object):
+    """Fake Xkl.ConfigRec"""
+
+    def __init__(self):
+        self.layouts = []
+        self.variants = []
+
+    def get_from_server(self, engine):
+        self.layouts = list(engine.layouts)
+        self.variants = list(engine.variants)
+
+    def set_layouts(self, layouts):
+        self.layouts = list(layouts)
+
+    def set_variants(self, variants):
+        self.variants = list(variants)
+
+    def activate(self, engine):
+        time.sleep(XKL_ACTIVATE_DELAY / 1000.0)
+        engine.layouts = list(self.layouts)
+        engine.variants = list(self.variants)
+        return True
+
+class XklConfigItem(object):
+    """Fake Xkl.ConfigItem"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+
+class XklConfigRegistry(object):
+    """Fake Xkl.ConfigRegistry, with the content of a layout index"""
+
+    __instance = None
+
+    @classmethod
+    def get_instance(cls, engine):
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self):
+        # layout code: (description, [(variant code, description)])
+        self.layouts = {}
+        # ISO-639 code: [layout codes]
+        self.languages = {}
+
+    def load(self, with_extras):
+        path = os.environ.get('TAILS_GREETER_FAKE_XKB_INDEX',
+                              tailsgreeter.config.xkb_index_path)
+        index = tailsgreeter.xkbindex.load_index(path)
+        if index is None:
+            index = tailsgreeter.xkbindex.build_index(
+                tailsgreeter.config.xkb_rules_path)
+        self.layouts = {}
+        for code, description in index['layouts'].items():
+            if '/' not in code:
+                self.layouts.setdefault(code, (description, []))
+        for code, description in index['layouts'].items():
+            if '/' in code:
+                layout, variant = code.split('/', 1)
+                layout_description = self.layouts[layout][0]
+                prefix = layout_description + ' - '
+                if description.startswith(prefix):
+                    description = description[len(prefix):]
+                self.layouts[layout][1].append((variant, description))
+        self.languages = index['languages']
+        return True
+
+    def foreach_layout(self, func, data):
+        for code in sorted(self.layouts):
+            func(self, XklConfigItem(code, self.layouts[code][0]), data)
+
+    def foreach_layout_variant(self, layout, func, data):
+        for code, description in sorted(self.layouts[layout][1]):
+            func(self, XklConfigItem(code, description), data)
+
+    def foreach_language_variant(self, language, func, data):
+        for code in self.languages.get(language, []):
+            func(self, XklConfigItem(code, self.layouts[code][0]), None, data)
@@ -19,10 +19,11 @@ Thin layer on top of libgdmgreeter.
 
 import logging
 
-from gi.repository import GdmGreeter
 from gi.repository import GLib
 
+import tailsgreeter.backends
 import tailsgreeter.config
+import tailsgreeter.tracing
 
 class GdmClient (object):
     """Greeter client class"""
@@ -34,7 +35,7 @@ class GdmClient (object):
         self.server_ready_cb = server_ready_cb
         self.session_opened_cb = session_opened_cb
 
-        self.__greeter_client = GdmGreeter.Client()
+        self.__greeter_client = tailsgreeter.backends.greeter_client()
         self.__greeter_client.open_connection()
 
         self.__greeter_client.connect('ready', self.__on_ready)
@@ -63,6 +64,7 @@ class GdmClient (object):
 
     def __on_session_opened(self, client, service_name):
         logging.debug("Received session opened")
+        tailsgreeter.tracing.instant('session opened')
         if self.session_opened_cb:
             self.session_opened_cb()
         client.call_start_session_when_ready(service_name, True)
@@ -101,10 +103,14 @@ class GdmClient (object):
         logging.debug("Received conversation stopped")
         raise NotImplementedError
 
+    @tailsgreeter.tracing.traced()
     def do_login(self, user_name):
         """Login using autologin"""
         if not self.server_ready:
             raise tailsgreeter.errors.GdmServerNotReady
 
-        GLib.idle_add(
-            lambda: self.__greeter_client.call_begin_auto_login(user_name))
+        def begin_auto_login():
+            with tailsgreeter.tracing.span('begin_auto_login'):
+                self.__greeter_client.call_begin_auto_login(user_name)
+
+        GLib.idle_add(begin_auto_login)
@@ -0,0 +1,487 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Privileged helper for persistence operations
+
+Instead of going through sudo for every command, the greeter starts this
+helper once as root (see tails-greeter-helper.py) and sends it requests.
+Each request and response is a JSON object on its own line, on the
+helper's stdin and stdout:
+
+    {"id": 1, "method": "unlock", "params": {"device": ...}}
+    {"id": 1, "result": {"cleartext_device": ...}}
+    {"id": 2, "error": {"type": "WrongPassphraseError", "message": ...}}
+
+Before its response, a request may get progress events, read from the
+commands output as it is produced:
+
+    {"id": 3, "event": {"phase": "mounting", "message": ...}}
+
+Requests are handled concurrently. A "cancel" request, without id,
+interrupts all running commands.
+
+The helper can also run as a stand-in (--stand-in), which pretends to
+perform the operations, so that the greeter can be exercised without root.
+When not running as root, the tools it runs can be replaced, e.g. by the
+fakes from tools/fake-backends:
+
+    tails-greeter-helper.py --cryptsetup=PATH --live-persist=PATH \
+        --live-persist-log=PATH
+"""
+
+import gettext
+_ = gettext.gettext
+
+import argparse
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+
+import tailsgreeter.config
+import tailsgreeter.errors
+
+# The tools run as root; they can only be replaced when not running as root
+CRYPTSETUP_PATH = '/sbin/cryptsetup'
+LIVE_PERSIST_PATH = '/usr/local/sbin/live-persist'
+LIVE_PERSIST_LOG_FILE = '/var/log/live-persist'
+
+class SystemBackend(object):
+    """Performs persistence operations with the system tools"""
+
+    def __init__(self, cryptsetup=CRYPTSETUP_PATH,
+                 live_persist=LIVE_PERSIST_PATH,
+                 live_persist_log=LIVE_PERSIST_LOG_FILE):
+        self.cryptsetup = cryptsetup
+        self.live_persist = live_persist
+        self.live_persist_log = live_persist_log
+        self.__lock = threading.Lock()
+        self.__procs = set()
+        self.__killed = set()
+
+    def run(self, args, stdin_data=None, on_line=None):
+        """Run a command, return its (returncode, stdout, stderr)
+
+        Its output is read as it is produced; on_line(line) is called for
+        each line. Raises OperationCancelledError if cancel() is called
+        meanwhile."""
+        with self.__lock:
+            # in its own process group, so that cancel() also interrupts
+            # the processes it starts, which keep its output open
+            proc = subprocess.Popen(
+                args, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                preexec_fn=os.setsid
+                )
+            self.__procs.add(proc)
+        if stdin_data:
+            proc.stdin.write(stdin_data)
+        proc.stdin.close()
+        out_lines = []
+        err_lines = []
+        readers = [
+            threading.Thread(target=self.__read_lines,
+                             args=(proc.stdout, out_lines, on_line)),
+            threading.Thread(target=self.__read_lines,
+                             args=(proc.stderr, err_lines, on_line)),
+            ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        proc.wait()
+        with self.__lock:
+            self.__procs.discard(proc)
+            if proc in self.__killed:
+                self.__killed.discard(proc)
+                raise tailsgreeter.errors.OperationCancelledError
+        return proc.returncode, ''.join(out_lines), ''.join(err_lines)
+
+    @staticmethod
+    def __read_lines(stream, lines, on_line):
+        for line in iter(stream.readline, ''):
+            # tools may output anything: make it valid UTF-8 for JSON
+            line = line.decode('utf-8', 'replace').encode('utf-8')
+            lines.append(line)
+            if on_line:
+                on_line(line.rstrip('\n'))
+
+    def cancel(self):
+        """Interrupt all running commands"""
+        with self.__lock:
+            for proc in self.__procs:
+                logging.debug("cancelling pid %s", proc.pid)
+                self.__killed.add(proc)
+                try:
+                    os.killpg(proc.pid, signal.SIGTERM)
+                except OSError as e:
+                    logging.debug("cannot kill process group %s: %s",
+                                  proc.pid, e)
+
+    def list(self, label, emit=None):
+        returncode, out, err = self.run(
+            [
+                self.live_persist,
+                "--log-file=%s" % self.live_persist_log,
+                "--encryption=luks",
+                "list", label
+            ])
+        if returncode:
+            raise tailsgreeter.errors.LivePersistError(
+                _("live-persist failed with return code %(returncode)s:\n%(stderr)s")
+                % { 'returncode': returncode, 'stderr': err }
+                )
+        return {
+            'containers': [{ 'device': device }
+                           for device in out.splitlines()],
+            }
+
+    def unlock(self, device, password, cleartext_name, emit=None):
+        emit = emit or _ignore
+        cleartext_device = '/dev/mapper/' + cleartext_name
+        if not os.path.exists(cleartext_device):
+            emit({ 'phase': 'unlocking', 'device': device })
+            args = [
+                self.cryptsetup, "luksOpen",
+                "--tries", "1",
+                device, cleartext_name
+                ]
+            returncode, out, err = self.run(
+                args, password.encode('utf-8') + "\n")
+            if returncode:
+                raise tailsgreeter.errors.WrongPassphraseError(
+                    _("cryptsetup failed with return code %(returncode)s:\n%(stdout)s\n%(stderr)s")
+                    % { 'returncode': returncode, 'stdout': out, 'stderr': err }
+                    )
+            logging.debug("cryptsetup success")
+        emit({ 'phase': 'unlocked', 'device': device })
+        return { 'cleartext_device': cleartext_device }
+
+    def activate(self, cleartext_devices, readonly, emit=None):
+        emit = emit or _ignore
+
+        def on_line(line):
+            emit(progress_event(line))
+
+        emit({ 'phase': 'activating' })
+        args = [ self.live_persist ]
+        if readonly:
+            args.append('--read-only')
+        else:
+            args.append('--read-write')
+        args.append('--log-file=%s' % self.live_persist_log)
+        args.append('activate')
+        args.extend(cleartext_devices)
+        returncode, out, err = self.run(args, on_line=on_line)
+        if returncode:
+            raise tailsgreeter.errors.LivePersistError(
+                _("live-persist failed with return code %(returncode)s:\n%(stdout)s\n%(stderr)s")
+                % { 'returncode': returncode, 'stdout': out, 'stderr': err }
+                )
+        emit({ 'phase': 'activated' })
+        return { 'cleartext_devices': cleartext_devices, 'readonly': readonly }
+
+class StandInBackend(object):
+    """Pretends to perform persistence operations, without root
+
+    The containers it lists and the passphrase it accepts are set with
+    the TAILS_GREETER_STAND_IN_CONTAINERS (space separated) and
+    TAILS_GREETER_STAND_IN_PASSPHRASE environment variables."""
+
+    def __init__(self):
+        self.containers = os.environ.get(
+            'TAILS_GREETER_STAND_IN_CONTAINERS', '/dev/sdb2').split()
+        self.passphrase = os.environ.get(
+            'TAILS_GREETER_STAND_IN_PASSPHRASE', 'passphrase')
+
+    def cancel(self):
+        pass
+
+    def list(self, label, emit=None):
+        return {
+            'containers': [{ 'device': device }
+                           for device in self.containers],
+            }
+
+    def unlock(self, device, password, cleartext_name, emit=None):
+        emit = emit or _ignore
+        emit({ 'phase': 'unlocking', 'device': device })
+        if password != self.passphrase:
+            raise tailsgreeter.errors.WrongPassphraseError(
+                "stand-in: wrong passphrase for %s" % device)
+        emit({ 'phase': 'unlocked', 'device': device })
+        return { 'cleartext_device': '/dev/mapper/' + cleartext_name }
+
+    def activate(self, cleartext_devices, readonly, emit=None):
+        emit = emit or _ignore
+        emit({ 'phase': 'activating' })
+        emit({ 'phase': 'activated' })
+        return { 'cleartext_devices': cleartext_devices, 'readonly': readonly }
+
+class HelperServer(object):
+    """Serves requests read from infile, writing responses to outfile"""
+
+    METHODS = ('list', 'unlock', 'activate')
+
+    def __init__(self, backend, infile=sys.stdin, outfile=sys.stdout):
+        self.backend = backend
+        self.infile = infile
+        self.outfile = outfile
+        self.__write_lock = threading.Lock()
+
+    def serve(self):
+        """Serve requests until infile is closed"""
+        for line in iter(self.infile.readline, ''):
+            try:
+                request = json.loads(line)
+            except ValueError:
+                logging.error("invalid request: %r", line)
+                continue
+            if request.get('method') == 'cancel':
+                self.backend.cancel()
+                continue
+            thread = threading.Thread(target=self.handle, args=(request,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, request):
+        response = { 'id': request.get('id') }
+        method = request.get('method')
+        try:
+            if method not in self.METHODS:
+                raise tailsgreeter.errors.HelperError(
+                    "unknown method %s" % method)
+            params = dict((str(k), v)
+                          for k, v in request.get('params', {}).items())
+            params['emit'] = lambda event: self.send(
+                { 'id': request.get('id'), 'event': event })
+            response['result'] = getattr(self.backend, method)(**params)
+        except Exception as e:
+            logging.debug("%s failed: %s", method, e)
+            response['error'] = {
+                'type': e.__class__.__name__,
+                'message': exception_message(e),
+                }
+        if not self.send(response):
+            # the client waits for a response, whatever happens
+            self.send({ 'id': request.get('id'), 'error': {
+                'type': 'HelperError',
+                'message': "cannot send the response to %s" % method,
+                }})
+
+    def send(self, message):
+        """Write message to outfile, return whether it could be sent"""
+        try:
+            data = json.dumps(message)
+        except (TypeError, ValueError) as e:
+            logging.error("cannot encode %r: %s", message, e)
+            return False
+        with self.__write_lock:
+            try:
+                self.outfile.write(data + '\n')
+                self.outfile.flush()
+            except IOError as e:
+                logging.error("cannot send %r: %s", message, e)
+                return False
+        return True
+
+class HelperClient(object):
+    """Sends requests to the helper, which is started on first use
+
+    call() blocks until the response arrives, so it should be used from
+    worker threads; several calls can be in flight at the same time."""
+
+    def __init__(self, command=None):
+        if command is None:
+            command = tailsgreeter.config.persistence_helper_command
+        self.command = command
+        self.__lock = threading.Lock()
+        self.__proc = None
+        # requests waiting for a response from self.__proc, by id
+        self.__pending = {}
+        self.__next_id = 0
+
+    def start(self):
+        """Start the helper, if not running yet"""
+        with self.__lock:
+            self.__start()
+
+    def __start(self):
+        if self.__proc and self.__proc.poll() is None:
+            return
+        logging.debug("starting helper: %s", self.command)
+        self.__proc = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # each process has its own pending requests, so that when one
+        # exits, only the requests sent to it fail
+        self.__pending = {}
+        reader = threading.Thread(target=self.__read,
+                                  args=(self.__proc, self.__pending),
+                                  name='helper-reader')
+        reader.daemon = True
+        reader.start()
+
+    def __read(self, proc, pending):
+        # whatever stops the reader, the calls waiting for it must fail
+        try:
+            self.__read_responses(proc, pending)
+        except Exception:
+            logging.exception("cannot read the helper responses")
+            proc.stdout.close()
+        else:
+            logging.warning("helper exited with return code %s", proc.wait())
+        with self.__lock:
+            requests = pending.values()
+            pending.clear()
+        for request in requests:
+            request['response'] = { 'error': {
+                'type': 'HelperError',
+                'message': "the helper exited",
+                }}
+            request['done'].set()
+
+    def __read_responses(self, proc, pending):
+        for line in iter(proc.stdout.readline, ''):
+            try:
+                response = json.loads(line)
+            except ValueError:
+                logging.error("invalid response from helper: %r", line)
+                continue
+            if 'event' in response:
+                with self.__lock:
+                    request = pending.get(response.get('id'))
+                if request and request['on_event']:
+                    try:
+                        request['on_event'](response['event'])
+                    except Exception:
+                        logging.exception("cannot handle helper event")
+                continue
+            with self.__lock:
+                request = pending.pop(response.get('id'), None)
+            if request:
+                request['response'] = response
+                request['done'].set()
+
+    def __send(self, message):
+        self.__proc.stdin.write(json.dumps(message) + '\n')
+        self.__proc.stdin.flush()
+
+    def call(self, method, on_event=None, **params):
+        """Send a request, wait for its result and return it
+
+        on_event(event) is called, from another thread, for each progress
+        event of the request. If the helper reports an error, the
+        exception of the same name from tailsgreeter.errors is raised."""
+        request = { 'done': threading.Event(), 'on_event': on_event }
+        with self.__lock:
+            self.__start()
+            self.__next_id += 1
+            request_id = self.__next_id
+            self.__pending[request_id] = request
+            try:
+                self.__send({ 'id': request_id, 'method': method,
+                              'params': params })
+            except IOError as e:
+                del self.__pending[request_id]
+                raise tailsgreeter.errors.HelperError(
+                    "cannot send request to the helper: %s" % e)
+        request['done'].wait()
+        response = request['response']
+        if 'error' in response:
+            raise error_from_response(response['error'])
+        return response['result']
+
+    def cancel(self):
+        """Interrupt the commands the helper is running"""
+        with self.__lock:
+            if self.__proc and self.__proc.poll() is None:
+                self.__send({ 'method': 'cancel' })
+
+    def stop(self):
+        """Let the helper exit"""
+        with self.__lock:
+            if self.__proc:
+                self.__proc.stdin.close()
+                self.__proc = None
+
+# Lines of the live-persist output telling what it is doing
+PROGRESS_PATTERNS = [
+    (re.compile(r'\bmount', re.IGNORECASE), 'mounting'),
+    (re.compile(r'\blink', re.IGNORECASE), 'linking'),
+    ]
+
+def progress_event(line):
+    """Return the progress event a line of live-persist output means"""
+    for pattern, phase in PROGRESS_PATTERNS:
+        if pattern.search(line):
+            return { 'phase': phase, 'message': line }
+    return { 'phase': 'output', 'message': line }
+
+def _ignore(event):
+    pass
+
+def exception_message(e):
+    """Return the message of e, as str or unicode, whichever it is"""
+    try:
+        return str(e)
+    except UnicodeError:
+        return unicode(e)
+
+def error_from_response(error):
+    """Return the exception described by an error response"""
+    exception_class = getattr(tailsgreeter.errors, error.get('type', ''), None)
+    if not (isinstance(exception_class, type) and
+            issubclass(exception_class, tailsgreeter.errors.TailsGreeterError)):
+        exception_class = tailsgreeter.errors.HelperError
+    message = error.get('message', '')
+    if isinstance(message, unicode):
+        # like the greeter's other strings, so that str(exception) works
+        message = message.encode('utf-8')
+    return exception_class(message)
+
+def main(argv):
+    logging.basicConfig(
+        stream=sys.stderr, level=logging.INFO,
+        format='[%(levelname)s] helper: %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stand-in', action='store_true',
+                        help='pretend to perform the operations')
+    parser.add_argument('--cryptsetup', help='cryptsetup to run')
+    parser.add_argument('--live-persist', help='live-persist to run')
+    parser.add_argument('--live-persist-log', help='live-persist log file')
+    options = parser.parse_args(argv[1:])
+    tools = dict((name, path) for name, path in (
+            ('cryptsetup', options.cryptsetup),
+            ('live_persist', options.live_persist),
+            ('live_persist_log', options.live_persist_log),
+            ) if path)
+    if tools and os.geteuid() == 0:
+        logging.error("the tools can only be replaced when not running as root")
+        return 1
+    if options.stand_in:
+        backend = StandInBackend()
+    else:
+        backend = SystemBackend(**tools)
+    HelperServer(backend).serve()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""ISO-639-2 codes
+
+ISO-639-2 languages have the same terminology (T) and bibliographic (B)
+codes, except the ones listed in TERMINOLOGY_TO_BIBLIOGRAPHIC. The table
+is static so that the greeter does not have to load pycountry's
+databases. To check it against pycountry, run:
+
+    python -m tailsgreeter.iso639
+"""
+
+import sys
+
+# ISO-639-2/T code: ISO-639-2/B code, for the codes that differ
+TERMINOLOGY_TO_BIBLIOGRAPHIC = {
+    'bod': 'tib',
+    'ces': 'cze',
+    'cym': 'wel',
+    'deu': 'ger',
+    'ell': 'gre',
+    'eus': 'baq',
+    'fas': 'per',
+    'fra': 'fre',
+    'hye': 'arm',
+    'isl': 'ice',
+    'kat': 'geo',
+    'mkd': 'mac',
+    'mri': 'mao',
+    'msa': 'may',
+    'mya': 'bur',
+    'nld': 'dut',
+    'ron': 'rum',
+    'slk': 'slo',
+    'sqi': 'alb',
+    'zho': 'chi',
+    }
+
+def terminology_to_bibliographic(code):
+    """Convert a ISO-639-2/T code (e.g. deu) to a ISO-639-2/B one (e.g. ger)"""
+    return TERMINOLOGY_TO_BIBLIOGRAPHIC.get(code, code)
+
+def generate_table():
+    """Return the T to B table, according to pycountry"""
+    import pycountry
+    table = {}
+    for language in pycountry.languages:
+        t_code = getattr(language, 'terminology', None) or \
+                 getattr(language, 'alpha_3', None)
+        b_code = getattr(language, 'bibliographic', None)
+        if t_code and b_code and t_code != b_code:
+            table[t_code] = b_code
+    return table
+
+def main(argv):
+    table = generate_table()
+    if table == TERMINOLOGY_TO_BIBLIOGRAPHIC:
+        return 0
+    print 'TERMINOLOGY_TO_BIBLIOGRAPHIC is out of date, it should be:'
+    print 'TERMINOLOGY_TO_BIBLIOGRAPHIC = {'
+    for t_code in sorted(table):
+        print "    '%s': '%s'," % (t_code, table[t_code])
+    print '    }'
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -24,20 +24,20 @@
 
 import logging
 import gettext
-import os
 import locale
+import time
 
-import pycountry
 import icu
 
 from gi.repository import GLib
-from gi.repository import Gdk
-from gi.repository import GdkX11
 from gi.repository import Gtk
-from gi.repository import Xkl
-from gi.repository import AccountsService
 
+import tailsgreeter.backends
 import tailsgreeter.config
+import tailsgreeter.iso639
+import tailsgreeter.tracing
+import tailsgreeter.utils
+import tailsgreeter.xkbindex
 
 def xkl_strip(string):
     """Clean strings returned by Xkl
@@ -55,14 +55,16 @@ def ln_iso639_tri(ln_CC):
 
 def ln_iso639_2_T_to_B(ln_CC):
     """Convert a ISO-639-2/T code (e.g. deu for German) to a 639-2/B one (e.g. ger for German)"""
-    return pycountry.languages.get(terminology=ln_CC).bibliographic
+    return tailsgreeter.iso639.terminology_to_bibliographic(ln_CC)
 
-def __fill_layouts_dict():
+def __walk_xkl_layouts():
     """assemble dictionary of layout codes to corresponding layout name
-    
+
+    This is the slow path, used only when the precomputed index is
+    unavailable.
     """
-    _xkl_engine = Xkl.Engine.get_instance(GdkX11.x11_get_default_xdisplay())
-    _xkl_registry = Xkl.ConfigRegistry.get_instance(_xkl_engine)
+    _xkl_engine = tailsgreeter.backends.xkl_engine()
+    _xkl_registry = tailsgreeter.backends.xkl_config_registry(_xkl_engine)
     _xkl_registry.load(False)
 
     layouts_dict = {}
@@ -85,6 +87,17 @@ def __fill_layouts_dict():
     _xkl_registry.foreach_layout(layout_iter, None)
     return layouts_dict
 
+def __fill_layouts_dict():
+    """assemble dictionary of layout codes to corresponding layout name
+
+    Read it from the precomputed index if possible, walk Xkl otherwise.
+    """
+    index = get_xkb_index()
+    if index:
+        return index['layouts']
+    logging.warning('no usable keyboard layout index, querying Xkl')
+    return __walk_xkl_layouts()
+
 def language_from_locale(locale):
     """Obtain the language code from a locale code
 
@@ -119,43 +132,98 @@ def countries_from_locales(locales):
             country_codes.append(country_code)
     return country_codes
 
-def language_name(language_code):
-    return icu.Locale(language_code).getDisplayLanguage(icu.Locale(language_code)).title()
-
-def country_name(locale_code):
-    return icu.Locale(locale_code).getDisplayCountry(icu.Locale(locale_code))
+def _icu_locale(code):
+    """Return a (shared) icu.Locale for code"""
+    icu_locale = _icu_locales.get(code)
+    if icu_locale is None:
+        icu_locale = icu.Locale(code)
+        _icu_locales[code] = icu_locale
+    return icu_locale
+
+def language_name(language_code, display_locale=None):
+    """Return the name of a language
+
+    By default, the name is given in the language itself."""
+    if display_locale is None:
+        display_locale = language_code
+    key = ('language', language_code, display_locale)
+    name = _display_names.get(key)
+    if name is None:
+        name = _icu_locale(language_code).getDisplayLanguage(
+            _icu_locale(display_locale)).title()
+        _display_names[key] = name
+    return name
+
+def country_name(locale_code, display_locale=None):
+    """Return the name of the country of a locale
+
+    By default, the name is given in the language of the locale."""
+    if display_locale is None:
+        display_locale = locale_code
+    key = ('country', locale_code, display_locale)
+    name = _display_names.get(key)
+    if name is None:
+        name = _icu_locale(locale_code).getDisplayCountry(
+            _icu_locale(display_locale))
+        _display_names[key] = name
+    return name
+
+def language_names(language_codes, display_locale=None):
+    """Return the names of a list of languages, see language_name()"""
+    return [language_name(l, display_locale) for l in language_codes]
+
+def country_names(locale_codes, display_locale=None):
+    """Return the country names of a list of locales, see country_name()"""
+    return [country_name(l, display_locale) for l in locale_codes]
 
 def layout_name(layout_code):
-    if layout_code in _system_layouts_dict:
-        return _system_layouts_dict[layout_code]
+    layouts_dict = get_system_layouts()
+    if layout_code in layouts_dict:
+        return layouts_dict[layout_code]
 
-def sort_by_name(list, locale='C'):
-    try:
-        # Note that we always collate with the 'C' locale.  This is far
-        # from ideal.  But proper collation always requires a specific
-        # language for its collation rules (languages frequently have
-        # custom sorting).  This at least gives us common sorting rules,
-        # like stripping accents.
-        collator = icu.Collator.createInstance(icu.Locale(locale))
-    except:
-        collator = None
-    def compare_choice(elt):
-        """comparison function"""
-        if collator:
+def _collator(locale):
+    """Return a (shared) collator for locale, or None if ICU has none"""
+    if locale not in _collators:
+        try:
+            _collators[locale] = icu.Collator.createInstance(_icu_locale(locale))
+        except icu.ICUError as e:
+            logging.warning('cannot create a collator for %s: %s', locale, e)
+            _collators[locale] = None
+    return _collators[locale]
+
+def sort_key(name, locale='C'):
+    """Return the (cached) key to sort name with in locale"""
+    key = (name, locale)
+    name_key = _sort_keys.get(key)
+    if name_key is None:
+        name_key = name
+        collator = _collator(locale)
+        if collator and name is not None:
             try:
-                return collator.getCollationKey(elt[1]).getByteArray()
-            except: # Specify exception
-                return elt[1]
-    list.sort(key=compare_choice)
+                name_key = collator.getCollationKey(name).getByteArray()
+            except icu.ICUError as e:
+                logging.debug('cannot collate %r in %s: %s', name, locale, e)
+        _sort_keys[key] = name_key
+    return name_key
+
+def sort_by_name(list, locale='C'):
+    """Sort a list of (code, name) by name, in place
+
+    Note that we always collate with the 'C' locale.  This is far
+    from ideal.  But proper collation always requires a specific
+    language for its collation rules (languages frequently have
+    custom sorting).  This at least gives us common sorting rules,
+    like stripping accents."""
+    list.sort(key=lambda elt: sort_key(elt[1], locale))
     return list
 
 def languages_with_names(languages, locale='C'):
-    languages_with_names = [(l, language_name(l)) for l in languages]
+    languages_with_names = zip(languages, language_names(languages))
     sort_by_name(languages_with_names, locale)
     return languages_with_names
  
 def locales_with_names(locales, locale='C'):
-    locales_with_names = [(l, country_name(l)) for l in locales]
+    locales_with_names = zip(locales, country_names(locales))
     sort_by_name(locales_with_names, locale)
     return locales_with_names
 
@@ -164,6 +232,51 @@ def layouts_with_names(layouts, locale='C'):
     sort_by_name(layouts_with_names, locale)
     return layouts_with_names
 
+def _find_layouts_for_language(language, add_layouts):
+    """Return the list of layouts for a language code
+
+    add_layouts(code, layouts) must append to layouts the layouts
+    available for the ISO-639 3-letter code."""
+    layouts = []
+    t_code = ln_iso639_tri(language)
+    if t_code == 'nno' or t_code == 'nob':
+        t_code = 'nor'
+    if t_code == 'hrv':
+        layouts.append('hr')
+
+    add_layouts(t_code, layouts)
+    b_code = ln_iso639_2_T_to_B(t_code)
+    if len(layouts) == 0 and b_code != t_code:
+        logging.debug(
+            'got no layout for ISO-639-2/T code %s, trying with ISO-639-2/B code %s',
+            t_code, b_code)
+        add_layouts(b_code, layouts)
+    return layouts
+
+def _add_indexed_layouts(code, layouts):
+    """Append to layouts the indexed layouts for a ISO-639 3-letter code"""
+    for layout_code in get_xkb_index()['languages'].get(code, []):
+        if layout_code not in layouts:
+            layouts.append(layout_code)
+
+def __fill_language_layouts_dict():
+    """assemble dictionary of language codes to corresponding layouts list
+
+    example {fr: [fr, ca, ch, be, ...], ...}"""
+    return dict((language, _find_layouts_for_language(language,
+                                                      _add_indexed_layouts))
+                for language in languages_from_locales(get_langcodes()))
+
+def layouts_for_language(language):
+    """Return the list of layouts for a language code, from the index
+
+    Must only be called if get_xkb_index() returns an index."""
+    layouts_dict = get_language_layouts()
+    if language not in layouts_dict:
+        layouts_dict[language] = _find_layouts_for_language(
+            language, _add_indexed_layouts)
+    return layouts_dict[language]
+
 def __get_langcodes():
     with open(tailsgreeter.config.default_langcodes_path, 'r') as f:
         defcodes = [ line.rstrip('\n') for line in f.readlines() ]
@@ -172,6 +285,27 @@ def __get_langcodes():
     logging.debug('%s languages found', len(langcodes))
     return defcodes + langcodes
 
+def get_translation(lang):
+    """Return the gettext catalog for a language, or None if there is none
+
+    Catalogs are shared by all windows and kept in a LRU cache; languages
+    without catalog are remembered too, so that they are looked up once."""
+    lang = str(lang)
+    if lang in _missing_translations:
+        return None
+    translation = _translations.get(lang)
+    if translation is None:
+        try:
+            translation = gettext.translation(tailsgreeter.__appname__,
+                                              tailsgreeter.config.locales_path,
+                                              [lang])
+        except IOError:
+            logging.debug('no translation found for %s', lang)
+            _missing_translations.add(lang)
+            return None
+        _translations[lang] = translation
+    return translation
+
 class TranslatableWindow(object):
     """Interface providing functions to translate a window on the fly
     """
@@ -181,7 +315,10 @@ class TranslatableWindow(object):
         self.window = window
         self.labels = []
         self.tips = []
+        # language to translate to when the window is next shown
+        self.pending_lang = None
         self.store_translations(self.window)
+        self.window.connect('show', self.__on_show)
 
     def store_translations(self, widget):
         """Go through all widgets and store the translatable elements"""
@@ -199,38 +336,70 @@ class TranslatableWindow(object):
             text = lang.gettext(text)
         return text
 
+    @tailsgreeter.tracing.traced()
     def translate_to(self, lang):
-        """Loop through everything and translate on the fly"""
-        try:
-            lang = gettext.translation(tailsgreeter.__appname__, tailsgreeter.config.locales_path, [str(lang)])
-        except IOError:
-            lang = None
-
-        for (child, text) in self.labels:
-            child.set_label(self.gettext(lang, text))
-        for (child, text) in self.tips:
-            child.set_tooltip_markup(self.gettext(lang, text))
-        if self.window.get_sensitive() and self.window.get_visible() and self.retain_focus:
+        """Translate everything on the fly
+
+        Hidden windows are translated when they are next shown."""
+        if not self.window.get_visible():
+            self.pending_lang = lang
+            return
+        self.pending_lang = None
+        self.apply_translation(lang)
+        if self.window.get_sensitive() and self.retain_focus:
             self.window.present()
 
+    def apply_translation(self, lang):
+        """Update the widgets whose text changes, with redraws suppressed"""
+        lang = get_translation(lang)
+
+        gdk_window = self.window.get_window()
+        if gdk_window:
+            gdk_window.freeze_updates()
+        try:
+            for (child, text) in self.labels:
+                translation = self.gettext(lang, text)
+                if child.get_label() != translation:
+                    child.set_label(translation)
+            for (child, text) in self.tips:
+                translation = self.gettext(lang, text)
+                if child.get_tooltip_markup() != translation:
+                    child.set_tooltip_markup(translation)
+        finally:
+            if gdk_window:
+                gdk_window.thaw_updates()
+
+    def __on_show(self, widget, data=None):
+        if self.pending_lang:
+            lang = self.pending_lang
+            self.pending_lang = None
+            self.apply_translation(lang)
+
 class LocalisationSettings(object):
     """Model storing settings related to language and keyboard
 
     """
-    def __init__(self, usermanager_loaded_cb=None, locale_selected_cb=None):
+
+    # milliseconds to wait for the layout selection to settle
+    LAYOUT_ACTIVATION_DELAY = 150
+
+    def __init__(self, settings, usermanager_loaded_cb=None,
+                 locale_selected_cb=None):
+        self.settings = settings
         self._usermanager_loaded_cb = usermanager_loaded_cb
         self._locale_selected_cb = locale_selected_cb
 
         self.__act_user = None
         self.__actusermanager_loadedid = None
 
-        self._xkl_engine = Xkl.Engine.get_instance(GdkX11.x11_get_default_xdisplay())
-        self._xkl_registry = Xkl.ConfigRegistry.get_instance(self._xkl_engine)
-        self._xkl_registry.load(False)
-        self._xkl_record = Xkl.ConfigRec()
+        self._xkl_engine = tailsgreeter.backends.xkl_engine()
+        self.__xkl_registry = None
+        self._xkl_record = tailsgreeter.backends.xkl_config_rec()
         self._xkl_record.get_from_server(self._xkl_engine)
 
-        self._system_locales_list = _langcodes
+        self.__layout_activation_id = None
+
+        self._system_locales_list = get_langcodes()
         self._system_locales_dict = self.__fill_locales_dict(self._system_locales_list)
 
         self._language = 'en'
@@ -238,7 +407,7 @@ class LocalisationSettings(object):
         self._layout = 'us'
         self._variant = ''
 
-        actusermanager = AccountsService.UserManager.get_default()
+        actusermanager = tailsgreeter.backends.user_manager()
         self.__actusermanager_loadedid = actusermanager.connect(
             "notify::is-loaded",  self.__on_usermanager_loaded)
 
@@ -269,18 +438,27 @@ class LocalisationSettings(object):
                 locales_dict[lang].append(locale)
         return locales_dict
 
+    @property
+    def _xkl_registry(self):
+        """Xkl registry, only loaded when the layout index can't be used"""
+        if self.__xkl_registry is None:
+            self.__xkl_registry = tailsgreeter.backends.xkl_config_registry(
+                self._xkl_engine)
+            self.__xkl_registry.load(False)
+        return self.__xkl_registry
+
     def __apply_layout_to_upcoming_session(self):
         layout = self._layout
         if self._variant:
             variant = self._variant
         else:
             variant = ''
-        with open(tailsgreeter.config.locale_output_path, 'w') as f:
-            os.chmod(tailsgreeter.config.locale_output_path, 0o600)
-            f.write('TAILS_LOCALE_NAME=%s\n' % self._locale)
-            f.write('TAILS_XKBMODEL=%s\n' % 'pc105') # use default value from /etc/default/keyboard
-            f.write('TAILS_XKBLAYOUT=%s\n' % layout)
-            f.write('TAILS_XKBVARIANT=%s\n' % variant)
+        self.settings.stage('locale', [
+            ('TAILS_LOCALE_NAME', self._locale),
+            ('TAILS_XKBMODEL', 'pc105'), # use default value from /etc/default/keyboard
+            ('TAILS_XKBLAYOUT', layout),
+            ('TAILS_XKBVARIANT', variant),
+            ])
 
     # LANGUAGES
 
@@ -335,6 +513,7 @@ class LocalisationSettings(object):
     def get_locale(self):
         return self._locale
 
+    @tailsgreeter.tracing.traced()
     def set_locale(self, locale):
         self._locale = locale
         self.__apply_locale()
@@ -375,43 +554,36 @@ class LocalisationSettings(object):
         """Return a list of all available keyboard layout codes
 
         """
-        layouts = _system_layouts_dict.keys()
+        layouts = get_system_layouts().keys()
         return layouts
 
     def get_layouts_with_names(self):
         return layouts_with_names(self.get_layouts(), self.get_locale())
 
+    @tailsgreeter.tracing.traced()
     def layouts_for_language(self):
         """Return the list of available layouts for given language
 
-        Query XKL and return layouts for a given language.
+        Look up the layouts index (or query XKL) for the current language.
         """
-        layouts = []
-        t_code = ln_iso639_tri(self._language)
-        if t_code == 'nno' or t_code == 'nob':
-            t_code = 'nor'
-        if t_code == 'hrv':
-            layouts.append('hr')
+        if get_xkb_index():
+            layouts = list(layouts_for_language(self._language))
+        else:
+            layouts = _find_layouts_for_language(self._language,
+                                                 self.__add_xkl_layouts)
+        logging.debug('got %d layouts for %s', len(layouts), self._language)
+        return layouts
 
+    def __add_xkl_layouts(self, code, layouts):
+        """Append to layouts the layouts XKL has for a ISO-639 3-letter code"""
         def language_iter(config_registry, item, subitem, store):
             layout_code = xkl_strip(item.name)
             if layout_code not in layouts:
                 layouts.append(layout_code)
 
-        self._xkl_registry.foreach_language_variant(t_code,
+        self._xkl_registry.foreach_language_variant(code,
                                                     language_iter,
                                                     layouts)
-        if len(layouts) == 0:
-            b_code = ln_iso639_2_T_to_B(t_code)
-            logging.debug(
-                'got no layout for ISO-639-2/T code %s, trying with ISO-639-2/B code %s',
-                t_code, b_code)
-            self._xkl_registry.foreach_language_variant(b_code,
-                                                        language_iter,
-                                                        layouts)
-
-        logging.debug('got %d layouts for %s', len(layouts), self._language)
-        return layouts
 
     def get_default_layouts(self):
         """Return list of supported keyboard layouts for current language
@@ -429,6 +601,7 @@ class LocalisationSettings(object):
     def get_layout(self):
         return self._layout
 
+    @tailsgreeter.tracing.traced()
     def set_layout(self, layout):
         try:
             layout, variant = layout.split('/')
@@ -469,24 +642,125 @@ class LocalisationSettings(object):
         self.set_layout(default_layout)            
 
     def __apply_layout_to_current_screen(self):
+        """Activate the layout once the selection has settled
+
+        Activating a layout makes the X server recompile its keymap, so
+        when the selection changes quickly (e.g. scrolling through the
+        layouts combobox), only the last one is activated."""
+        if self.__layout_activation_id:
+            GLib.source_remove(self.__layout_activation_id)
+        self.__layout_activation_id = GLib.timeout_add(
+            self.LAYOUT_ACTIVATION_DELAY, self.__on_layout_activation_timeout)
+
+    def __on_layout_activation_timeout(self):
+        self.__layout_activation_id = None
+        self.__activate_layout()
+        return False
+
+    def __activate_layout(self):
         logging.debug("layout=%s" % self._layout)
+        start = time.time()
 
         self._xkl_record.set_layouts([self._layout])
         self._xkl_record.set_variants([self._variant])
         self._xkl_record.activate(self._xkl_engine)
         # try to 'enforce layout'
-        self._xkl_engine.start_listen(Xkl.EngineListenModes.TRACK_KEYBOARD_STATE)
+        track_keyboard_state = tailsgreeter.backends.xkl_track_keyboard_state()
+        self._xkl_engine.start_listen(track_keyboard_state)
         self._xkl_engine.lock_group(1)
-        self._xkl_engine.stop_listen(Xkl.EngineListenModes.TRACK_KEYBOARD_STATE)
+        self._xkl_engine.stop_listen(track_keyboard_state)
 
         logging.debug('L:%s V:%s',
                        self._xkl_record.layouts,
                        self._xkl_record.variants)
+        logging.info('activated layout %s in %.3fs',
+                     self._layout, time.time() - start)
+
+# MODULE STATE
+#
+# These tables are built on first access rather than at import time, so
+# that importing this module stays cheap. Call warm_up() to build them
+# ahead of time, and invalidate() to have them rebuilt on next access.
 
-# MODULE INITIALISATION
+# precomputed keyboard layout index, None if missing or out of date
+_xkb_index = None
+_xkb_index_loaded = False
 
 # List of system locale codes
-_langcodes = __get_langcodes()
+_langcodes = None
 
 # dictionary of layout codes: layout name
-_system_layouts_dict = __fill_layouts_dict()
+_system_layouts_dict = None
+
+# dictionary of language codes: layout codes list
+_language_layouts_dict = None
+
+# display names resolved through ICU, keyed by (kind, code, display locale)
+_display_names = tailsgreeter.utils.LRUCache(2048)
+
+# icu.Locale objects by locale code
+_icu_locales = {}
+
+# icu.Collator objects (or None if unavailable) by locale code
+_collators = {}
+
+# collation keys, keyed by (name, locale)
+_sort_keys = tailsgreeter.utils.LRUCache(8192)
+
+# gettext catalogs by language
+_translations = tailsgreeter.utils.LRUCache(8)
+
+# languages we have no gettext catalog for
+_missing_translations = set()
+
+def get_xkb_index():
+    """Return the precomputed keyboard layout index, or None"""
+    global _xkb_index, _xkb_index_loaded
+    if not _xkb_index_loaded:
+        _xkb_index = tailsgreeter.xkbindex.load_index()
+        _xkb_index_loaded = True
+    return _xkb_index
+
+def get_langcodes():
+    """Return the list of system locale codes"""
+    global _langcodes
+    if _langcodes is None:
+        _langcodes = __get_langcodes()
+    return _langcodes
+
+def get_system_layouts():
+    """Return the dictionary of layout codes: layout name"""
+    global _system_layouts_dict
+    if _system_layouts_dict is None:
+        _system_layouts_dict = __fill_layouts_dict()
+    return _system_layouts_dict
+
+def get_language_layouts():
+    """Return the dictionary of language codes: layout codes list"""
+    global _language_layouts_dict
+    if _language_layouts_dict is None:
+        _language_layouts_dict = __fill_language_layouts_dict()
+    return _language_layouts_dict
+
+def warm_up():
+    """Build all module tables now instead of on first access"""
+    get_langcodes()
+    get_system_layouts()
+    if get_xkb_index():
+        get_language_layouts()
+
+def invalidate():
+    """Forget all module tables, they will be rebuilt on next access"""
+    global _xkb_index, _xkb_index_loaded, _langcodes, _system_layouts_dict
+    global _language_layouts_dict
+    _xkb_index = None
+    _xkb_index_loaded = False
+    _langcodes = None
+    _system_layouts_dict = None
+    _language_layouts_dict = None
+    _display_names.clear()
+    _icu_locales.clear()
+    _collators.clear()
+    _sort_keys.clear()
+    _translations.clear()
+    _missing_translations.clear()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Login sequence
+
+From the login button to GDM's auto-login, in stages:
+- validate: check the selected options, and that GDM is ready;
+- persistence: wait for persistence activation, if it is running;
+- persist: stage the selected options in the settings store;
+- flush: write the settings store to disk, in a worker thread;
+- login: ask GDM to begin auto-login.
+Auto-login only begins once the settings are on disk, so PostLogin never
+has to cope with missing files.
+"""
+
+import logging
+import time
+
+import tailsgreeter.config
+import tailsgreeter.errors
+import tailsgreeter.utils
+
+class LoginPipeline(object):
+    """Run the login stages, timing each of them"""
+
+    def __init__(self, greeter):
+        self.greeter = greeter
+        # whether login was started, and not stopped by a failure
+        self.running = False
+        # (stage, duration in seconds) of the last login attempt
+        self.timings = []
+        self.__persist = None
+        self.__working = None
+        self.__start = None
+        self.__stage = None
+        self.__stage_start = None
+
+    def start(self, validate=None, persist=None, working=None):
+        """Start login
+
+        validate() must return whether the selected options are valid,
+        persist() stages them in the settings store, and working(state)
+        shows that login is in progress. Returns whether login started."""
+        if self.running:
+            logging.debug("login is already in progress")
+            return False
+        self.timings = []
+        self.__stage = None
+        self.__start = time.time()
+        self.__begin_stage('validate')
+        if validate and not validate():
+            logging.debug("login options are not valid")
+            return False
+        if not self.greeter.gdmclient.server_ready:
+            raise tailsgreeter.errors.GdmServerNotReady
+        self.running = True
+        self.__persist = persist
+        self.__working = working
+        self.__set_working(True)
+        if self.greeter.persistencewindow.activating:
+            self.__begin_stage('persistence')
+            logging.info("waiting for persistence activation before login")
+            self.greeter.persistencewindow.run_after_activation(
+                self.__persist_settings, self.__abort)
+        else:
+            self.__persist_settings()
+        return True
+
+    def __begin_stage(self, stage):
+        now = time.time()
+        if self.__stage:
+            self.timings.append((self.__stage, now - self.__stage_start))
+        self.__stage = stage
+        self.__stage_start = now
+
+    def __set_working(self, working):
+        if self.__working:
+            self.__working(working)
+
+    def __persist_settings(self):
+        self.__begin_stage('persist')
+        if self.__persist:
+            self.__persist()
+        self.__begin_stage('flush')
+        tailsgreeter.utils.run_in_thread(
+            self.greeter.settings.commit,
+            callback=self.__begin_login, errback=self.__abort)
+
+    def __begin_login(self, result=None):
+        self.__begin_stage('login')
+        self.greeter.gdmclient.do_login(tailsgreeter.config.LUSER)
+        # stay running: the session is about to start
+        self.__begin_stage(None)
+        logging.info("login requested in %.3fs (%s)",
+                     time.time() - self.__start,
+                     ', '.join('%s: %.3fs' % timing for timing in self.timings))
+
+    def __abort(self, error=None):
+        """Stop login, after a failure in the current stage"""
+        stage = self.__stage
+        self.__begin_stage(None)
+        self.running = False
+        self.__set_working(False)
+        if error is not None and stage == 'flush':
+            logging.error("cannot write settings for the session: %s", error)
+        else:
+            logging.info("login stopped during %s stage", stage)
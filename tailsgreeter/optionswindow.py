@@ -21,7 +21,7 @@
 """
 
 from gi.repository import Gdk, Gtk
-import logging, os
+import os
 import tailsgreeter
 from tailsgreeter.language import TranslatableWindow
 from tailsgreeter.helpwindow import HelpWindow
@@ -111,6 +111,16 @@ class OptionsWindow(TranslatableWindow):
         else:
             self.greeter.physical_security.netconf = self.greeter.physical_security.NETCONF_OBSTACLE
 
+    def working(self, working=True):
+        """Show that login is waiting for something"""
+        self.window.set_sensitive(not working)
+        gdk_window = self.window.get_window()
+        if gdk_window:
+            if working:
+                gdk_window.set_cursor(Gdk.Cursor.new(Gdk.CursorType.WATCH))
+            else:
+                gdk_window.set_cursor(None)
+
     def validate_options(self):
         """Validate the selected options"""
         auth_password = self.entry_password.get_text()
@@ -120,14 +130,18 @@ class OptionsWindow(TranslatableWindow):
             self.warning_area.show()
         return passwords_match
 
+    def set_options(self):
+        """Activate the selected options"""
+        self.set_password()
+        self.set_camouflage()
+        self.set_macspoof()
+        self.set_netconf()
+
     def set_options_and_login(self):
-        """Activate the selected options if they are valid"""
-        if self.validate_options():
-            self.greeter.login()
-            self.set_password()
-            self.set_camouflage()
-            self.set_macspoof()
-            self.set_netconf()
+        """Activate the selected options and login, if they are valid"""
+        self.greeter.login(validate=self.validate_options,
+                           persist=self.set_options,
+                           working=self.working)
 
     def cb_login_clicked(self, widget, data=None):
         """Login button click handler"""
@@ -21,106 +21,203 @@
 
 """
 import logging
-import os
-import subprocess
+import multiprocessing
+import time
 
-import gettext
-_ = gettext.gettext
+from gi.repository import Gio
+from gi.repository import GLib
 
 import tailsgreeter
 import tailsgreeter.config
 import tailsgreeter.errors
+import tailsgreeter.helper
+import tailsgreeter.tracing
+import tailsgreeter.utils
 from tailsgreeter.utils import unicode_to_utf8
 
 class PersistenceSettings(object):
     """Model storing settings related to persistence
 
     """
-    def __init__(self):
-        pass
+    def __init__(self, settings, helper=None):
+        self.settings = settings
+        if helper is None:
+            helper = tailsgreeter.helper.HelperClient()
+        self.helper = helper
+        self.__cancelled = False
+        # once live-persist is mounting, cancelling would leave
+        # persistence half activated
+        self.__cancellable = True
+        self.__progress_cb = None
+        self.__activation_start = time.time()
+        # containers found by the last discovery, None until it is done
+        self.containers = None
+        self.__containers_cb = None
+        self.__discovering = False
+        self.__rediscover = False
+        self.__volume_monitor = None
+
+    def __check_cancelled(self):
+        if self.__cancelled:
+            raise tailsgreeter.errors.OperationCancelledError
+
+    def cancel(self):
+        """Interrupt the running activation, unless persistence is already
+        being set up"""
+        if not self.__cancellable:
+            logging.info("persistence is being set up, cannot cancel")
+            return
+        self.__cancelled = True
+        self.helper.cancel()
 
     def list_containers(self):
         """Returns a list of persistence containers we might want to unlock."""
-        proc = subprocess.Popen(
-            [
-                "/usr/bin/sudo", "-n", "/usr/local/sbin/live-persist",
-                "--log-file=/var/log/live-persist",
-                "--encryption=luks",
-                "list", "TailsData"
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-            )
-        out, err = proc.communicate()
-        out = unicode_to_utf8(out)
-        err = unicode_to_utf8(err)
-        if proc.returncode:
-            raise tailsgreeter.errors.LivePersistError(
-                _("live-persist failed with return code %(returncode)s:\n%(stderr)s")
-                % { 'returncode': proc.returncode, 'stderr': err }
-                )
-        containers = str.splitlines(out)
+        result = self.helper.call('list', label='TailsData')
+        containers = [unicode_to_utf8(container['device'])
+                      for container in result['containers']]
         logging.debug("found containers: %s", containers)
         return containers
 
-    def activate(self, device, password, readonly):
-        cleartext_device = self.unlock_device(device, password)
-        logging.debug("unlocked cleartext_device: %s", cleartext_device)
-        self.setup_persistence(cleartext_device, readonly)
-        with open(tailsgreeter.config.persistence_state_file, 'w') as f:
-            os.chmod(tailsgreeter.config.persistence_state_file, 0o600)
-            f.write('TAILS_PERSISTENCE_ENABLED=true\n')
-            if readonly:
-                f.write('TAILS_PERSISTENCE_READONLY=true\n')
-
-    def unlock_device(self, device, password):
-        """Unlock the LUKS persistent device"""
-        cleartext_name = 'TailsData_unlocked'
-        cleartext_device = '/dev/mapper/' + cleartext_name
-        if not os.path.exists(cleartext_device):
-            args = [
-                "/usr/bin/sudo", "-n",
-                "/sbin/cryptsetup", "luksOpen",
-                "--tries", "1",
-                device, cleartext_name
-                ]
-            proc = subprocess.Popen(
-                args, stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                )
-            out, err = proc.communicate(password + "\n")
-            out = unicode_to_utf8(out)
-            err = unicode_to_utf8(err)
-            if proc.returncode:
-                logging.debug(
-                    "cryptsetup failed with return code %(returncode)s:\n%(stdout)s\n%(stderr)s"
-                    % { 'returncode': proc.returncode, 'stdout': out, 'stderr': err })
-                raise tailsgreeter.errors.WrongPassphraseError(
-                    _("cryptsetup failed with return code %(returncode)s:\n%(stdout)s\n%(stderr)s")
-                    % { 'returncode': proc.returncode, 'stdout': out, 'stderr': err }
-                    )
-            logging.debug("crytpsetup success")
-        return cleartext_device
-
-    def setup_persistence(self, cleartext_device, readonly):
-        args = [ "/usr/bin/sudo", "-n", "/usr/local/sbin/live-persist" ]
+    def watch_containers(self, callback):
+        """Discover containers in the background, and again on hotplug
+
+        callback(containers) is called from the main loop each time a
+        discovery completes."""
+        self.__containers_cb = callback
+        self.__volume_monitor = Gio.VolumeMonitor.get()
+        self.__volume_monitor.connect('volume-added', self.__on_volumes_changed)
+        self.__volume_monitor.connect('volume-removed', self.__on_volumes_changed)
+        self.__discover_containers()
+
+    def __on_volumes_changed(self, monitor, volume):
+        logging.debug("volume %s changed, discovering containers", volume.get_name())
+        self.__discover_containers()
+
+    def __discover_containers(self):
+        if self.__discovering:
+            # restart once the running discovery is done
+            self.__rediscover = True
+            return
+        self.__discovering = True
+        self.__rediscover = False
+        tailsgreeter.utils.run_in_thread(
+            self.list_containers, (),
+            self.__on_containers_discovered,
+            self.__on_containers_discovery_failed)
+
+    def __on_containers_discovered(self, containers):
+        self.__discovering = False
+        self.containers = containers
+        if self.__containers_cb:
+            self.__containers_cb(containers)
+        if self.__rediscover:
+            self.__discover_containers()
+
+    def __on_containers_discovery_failed(self, error):
+        self.__discovering = False
+        logging.error("cannot list persistence containers: %s", error)
+        if self.__rediscover:
+            self.__discover_containers()
+
+    def activate(self, devices, password, readonly):
+        """Unlock devices with password, then activate persistence on them
+
+        Returns (cleartext devices, failures), where failures lists the
+        (device, error) of the devices that could not be unlocked."""
+        self.__activation_start = time.time()
+        cleartext_devices, failures = self.unlock_devices(devices, password)
+        logging.debug("unlocked cleartext_devices: %s", cleartext_devices)
+        self.setup_persistence(cleartext_devices, readonly)
+        variables = [('TAILS_PERSISTENCE_ENABLED', 'true')]
         if readonly:
-            args.append('--read-only')
-        else:
-            args.append('--read-write')
-        args.append('--log-file=/var/log/live-persist')
-        args.append('activate')
-        args.append(cleartext_device)
-        proc = subprocess.Popen(
-            args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-            )
-        out, err = proc.communicate()
-        out = unicode_to_utf8(out)
-        err = unicode_to_utf8(err)
-        if proc.returncode:
-            raise tailsgreeter.errors.LivePersistError(
-                _("live-persist failed with return code %(returncode)s:\n%(stdout)s\n%(stderr)s")
-                % { 'returncode': proc.returncode, 'stdout': out, 'stderr': err }
-                )
+            variables.append(('TAILS_PERSISTENCE_READONLY', 'true'))
+        self.settings.stage('persistence', variables)
+        logging.info("persistence activated in %.3fs",
+                     time.time() - self.__activation_start)
+        return cleartext_devices, failures
+
+    def activate_async(self, devices, password, readonly,
+                       callback=None, errback=None, progress_cb=None):
+        """Run activate() without blocking the main loop
+
+        callback(result) is called with the result of activate() once
+        persistence is activated, errback(e) if activate() raised e
+        (OperationCancelledError if cancel() was called), and
+        progress_cb(event) for each progress event, such as
+        {'phase': 'unlocking', 'device': '/dev/sdb2'}. All are called
+        from the main loop."""
+        self.__cancelled = False
+        self.__cancellable = True
+        self.__progress_cb = progress_cb
+        tailsgreeter.utils.run_in_thread(
+            self.activate, (devices, password, readonly), callback, errback)
+
+    @staticmethod
+    def cleartext_name(index):
+        """Return the device mapper name for the index-th container"""
+        if index == 0:
+            return 'TailsData_unlocked'
+        return 'TailsData_%d_unlocked' % (index + 1)
+
+    def unlock_devices(self, devices, password):
+        """Unlock the LUKS persistent devices in parallel
+
+        Unlocking is CPU-bound, so at most one device per core is
+        unlocked at a time. Devices that cannot be unlocked are skipped,
+        unless none can be: then the first error is raised.
+        Returns (cleartext devices, failures), where failures lists the
+        (device, error) of the skipped devices."""
+        def unlock(indexed_device):
+            index, device = indexed_device
+            return self.unlock_device(device, password,
+                                      self.cleartext_name(index))
+
+        results = tailsgreeter.utils.parallel_map(
+            unlock, list(enumerate(devices)), multiprocessing.cpu_count())
+        cleartext_devices = []
+        failures = []
+        for device, (cleartext_device, error) in zip(devices, results):
+            if error:
+                logging.warning("cannot unlock %s: %s", device, error)
+                failures.append((device, error))
+            else:
+                cleartext_devices.append(cleartext_device)
+        self.__check_cancelled()
+        if not cleartext_devices:
+            raise failures[0][1]
+        return cleartext_devices, failures
+
+    @tailsgreeter.tracing.traced()
+    def unlock_device(self, device, password, cleartext_name='TailsData_unlocked'):
+        """Unlock the LUKS persistent device"""
+        self.__check_cancelled()
+        result = self.helper.call('unlock', on_event=self.__on_progress,
+                                  device=device, password=password,
+                                  cleartext_name=cleartext_name)
+        logging.debug("crytpsetup success")
+        return unicode_to_utf8(result['cleartext_device'])
+
+    @tailsgreeter.tracing.traced()
+    def setup_persistence(self, cleartext_devices, readonly):
+        self.__check_cancelled()
+        self.__cancellable = False
+        self.helper.call('activate', on_event=self.__on_progress,
+                         cleartext_devices=cleartext_devices,
+                         readonly=readonly)
+
+    def __on_progress(self, event):
+        """Log the time of a progress event and pass it to the main loop"""
+        # decoded from the helper's JSON: encode it like the other strings
+        event = dict((str(key), unicode_to_utf8(value))
+                     for key, value in event.items())
+        logging.info("persistence %s %s at +%.3fs",
+                     event.get('phase'),
+                     event.get('device') or event.get('message', ''),
+                     time.time() - self.__activation_start)
+        if self.__progress_cb:
+            GLib.idle_add(self.__deliver_progress, self.__progress_cb, event)
+
+    @staticmethod
+    def __deliver_progress(progress_cb, event):
+        progress_cb(event)
+        return False
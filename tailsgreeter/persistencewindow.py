@@ -21,12 +21,26 @@
 
 """
 
-from gi.repository import Gdk, Gtk
+from gi.repository import Gdk, GLib, Gtk
 import logging, os
 import tailsgreeter
-from tailsgreeter.language import TranslatableWindow
+import tailsgreeter.config
+import tailsgreeter.errors
+from tailsgreeter.language import TranslatableWindow, get_translation
 from tailsgreeter.helpwindow import HelpWindow
 
+def escape_params(params):
+    """Return the parameters of a message, escaped for markup"""
+    if isinstance(params, dict):
+        return dict((key, GLib.markup_escape_text(value))
+                    for key, value in params.items())
+    return tuple(GLib.markup_escape_text(param) for param in params)
+
+def N_(message):
+    """Mark message for translation, it is translated when shown, in the
+    language of the window"""
+    return message
+
 class PersistenceWindow(TranslatableWindow):
     """First greeter screen"""
 
@@ -41,6 +55,11 @@ class PersistenceWindow(TranslatableWindow):
         self.tails_specific = False # TODO: Depend on a runtime check
 
         self.moreoptions = False
+        self.activating = False
+        # persistence was activated, on some of the containers
+        self.activated = False
+        self.speculative = False
+        self.after_activation = []
 
         # Sets self.window
         self.login_dialog = builder.get_object("login_dialog")
@@ -59,7 +78,8 @@ class PersistenceWindow(TranslatableWindow):
         self.warning_label = builder.get_object("warning_label")
         self.warning_area = builder.get_object("warning_area")
         self.warning_image = builder.get_object("warning_area")
-        # self.spinner = builder.get_object("spinner")
+        self.spinner = builder.get_object("spinner")
+        self.btn_cancel = builder.get_object("cancel_button")
         self.checked_img_moreoptions_yes = builder.get_object("moreoptions_yes_checked_img")
         self.checked_img_moreoptions_no  = builder.get_object("moreoptions_no_checked_img")
         self.checked_img_persistence_yes = builder.get_object("persistence_yes_checked_img")
@@ -67,46 +87,198 @@ class PersistenceWindow(TranslatableWindow):
         self.main_label = builder.get_object("main_label")
 
         self.warning_area.hide()
+        # The warning label shows the wrong passphrase message of the glade
+        # file, or the (message, parameters) of self.warnings: untranslated
+        # markup, so that they can be retranslated
+        self.wrong_passphrase_message = self.warning_label.get_label()
+        self.warnings = []
+
+        # gettext catalog of the language the window is shown in
+        self.translation = None
 
-        # FIXME: list_containers may raise exceptions. Deal with that.
+        # Not part of the glade file, so that it is not retranslated; shows
+        # the (message, parameters) of self.progress
+        self.progress = None
+        self.progress_label = Gtk.Label()
+        action_area = builder.get_object("dialog-action_area1")
+        action_area.pack_start(self.progress_label, False, False, 0)
+        action_area.reorder_child(self.progress_label, 1)
+
+        # Containers are discovered in the background, see set_containers()
+        self.containers = []
         if self.tails_specific:
-                self.containers = [
-                { "path": container, "locked": True }
-                for container in self.greeter.persistence.list_containers()
-                ]
-                if len(self.containers) == 0:
-                    self.box_persistence.hide()
+            self.box_persistence.hide()
         else:
             self.box_persistence.hide()
             self.box_moreoptions.hide()
             self.main_label.hide()
 
         # FIXME:
-        # * support multiple persistent containers:
+        # * better support multiple persistent containers (for now, they
+        #   are all unlocked with the same passphrase):
         #   - display brand, model, partition path and size for each container
         #   - create as many passphrase input fields as needed
 
     # Help callback handler
     cb_doc_handler = HelpWindow.cb_doc_handler
 
-    def activate_persistence(self):
-        """Ask the backend to activate persistence and handle errors
-
-        Returns: True if everything went fine, False if the user should try again"""
-        if self.btn_persistence_yes.get_active():
-            try:
-                self.greeter.persistence.activate(
-                    device=self.containers[0]['path'],
-                    password=self.entry_passphrase.get_text(),
-                    readonly=self.readonly_checkbutton.get_active()
-                    )
-                return True
-            except tailsgreeter.errors.WrongPassphraseError:
-                self.entry_passphrase.set_text('')
-                self.warning_area.show_all()
-                return False
+    def set_containers(self, containers):
+        """Update the persistence containers we might want to unlock"""
+        if not self.tails_specific:
+            return
+        self.containers = [
+            { "path": container, "locked": True }
+            for container in containers
+            ]
+        self.box_persistence.set_visible(len(self.containers) > 0)
+
+    def activate_persistence(self, speculative=False):
+        """Ask the backend to activate persistence, without blocking
+
+        Calls proceed() once persistence is activated, or lets the user
+        try again if it fails. If speculative, the caller moves on to the
+        next screen right away, and login must wait for the activation
+        through run_after_activation()."""
+        self.activating = True
+        self.speculative = speculative
+        if not speculative:
+            self.working(True)
+        self.greeter.persistence.activate_async(
+            devices=[container['path'] for container in self.containers],
+            password=self.entry_passphrase.get_text(),
+            readonly=self.readonly_checkbutton.get_active(),
+            callback=self.cb_persistence_activated,
+            errback=self.cb_persistence_activation_failed,
+            progress_cb=self.cb_persistence_progress
+            )
+
+    def run_after_activation(self, callback, errback=None):
+        """Call callback() once persistence is activated, if it is being
+        activated, or right away otherwise
+
+        errback(error) is called instead if the activation fails."""
+        if self.activating:
+            self.after_activation.append((callback, errback))
         else:
-            return True
+            callback()
+
+    def cb_persistence_progress(self, event):
+        phase = event.get('phase')
+        if phase == 'unlocking':
+            progress = (N_("Unlocking %s..."), (event.get('device'),))
+        elif phase == 'activating':
+            # cancelling now would leave persistence half activated
+            self.btn_cancel.set_sensitive(False)
+            progress = (N_("Activating persistence..."), ())
+        elif phase == 'mounting':
+            progress = (N_("Mounting persistent volume..."), ())
+        elif phase == 'linking':
+            progress = (N_("Linking persistent files..."), ())
+        else:
+            return
+        self.progress = progress
+        self.update_progress_label()
+
+    def update_progress_label(self):
+        if self.progress:
+            message, params = self.progress
+            self.progress_label.set_text(self.translate(message) % params)
+        else:
+            self.progress_label.set_text('')
+
+    def cb_persistence_activated(self, result):
+        cleartext_devices, failures = result
+        self.activating = False
+        self.activated = True
+        self.working(False)
+        callbacks, self.after_activation = self.after_activation, []
+        if failures:
+            self.cb_persistence_partially_activated(failures, callbacks)
+            return
+        if not self.speculative:
+            self.proceed()
+        for callback, errback in callbacks:
+            callback()
+
+    def cb_persistence_partially_activated(self, failures, callbacks):
+        """Tell which containers could not be unlocked, before moving on
+
+        Persistence is active on the other containers, so the next click
+        on Login or Next proceeds without unlocking again."""
+        self.btn_persistence_yes.set_sensitive(False)
+        self.btn_persistence_no.set_sensitive(False)
+        self.entry_passphrase.set_sensitive(False)
+        self.readonly_checkbutton.set_sensitive(False)
+        warnings = []
+        for device, error in failures:
+            if isinstance(error, tailsgreeter.errors.WrongPassphraseError):
+                warnings.append((
+                    N_("<i>Wrong passphrase for %s, it was not unlocked.</i>"),
+                    (device,)))
+            else:
+                warnings.append((
+                    N_("<i>%(device)s could not be unlocked: %(error)s</i>"),
+                    { 'device': device, 'error': str(error) }))
+        self.show_warnings(warnings)
+        error = tailsgreeter.errors.LivePersistError(
+            "%d persistent volumes could not be unlocked" % len(failures))
+        for callback, errback in callbacks:
+            if errback:
+                errback(error)
+        if self.speculative:
+            # back to this screen, so that the user sees the warnings
+            self.greeter.optionswindow.working(False)
+            self.greeter.optionswindow.window.hide()
+            self.window.show()
+
+    def cb_persistence_activation_failed(self, error):
+        self.activating = False
+        callbacks, self.after_activation = self.after_activation, []
+        self.working(False)
+        for callback, errback in callbacks:
+            if errback:
+                errback(error)
+        if self.speculative:
+            # back to this screen, so that the user can try again
+            self.greeter.optionswindow.working(False)
+            self.greeter.optionswindow.window.hide()
+            self.window.show()
+        if isinstance(error, tailsgreeter.errors.WrongPassphraseError):
+            self.entry_passphrase.set_text('')
+            self.show_warnings([(self.wrong_passphrase_message, ())])
+        elif isinstance(error, tailsgreeter.errors.OperationCancelledError):
+            logging.debug("persistence activation cancelled")
+        else:
+            logging.error("persistence activation failed: %s", error)
+            self.show_warnings([(
+                N_("<i>Persistence could not be activated: %s</i>"),
+                (str(error),))])
+
+    def show_warnings(self, warnings):
+        """Show warnings, a list of (message, parameters), in the warning
+        area
+
+        The parameters, a tuple or a dictionary for named placeholders,
+        are escaped for the markup of the messages."""
+        self.warnings = warnings
+        self.update_warning_label()
+        self.warning_area.show_all()
+
+    def update_warning_label(self):
+        self.warning_label.set_markup('\n'.join(
+            self.translate(message) % escape_params(params)
+            for message, params in self.warnings))
+
+    def translate(self, message):
+        """Return message translated to the language of the window"""
+        return self.gettext(self.translation, message)
+
+    def apply_translation(self, lang):
+        TranslatableWindow.apply_translation(self, lang)
+        self.translation = get_translation(lang)
+        if self.warnings:
+            self.update_warning_label()
+        self.update_progress_label()
 
     def set_persistence_visibility(self, persistence):
         self.passphrase_box.set_visible(persistence)
@@ -171,26 +343,43 @@ class PersistenceWindow(TranslatableWindow):
     def working(self, working=True):
         # FIXME: set_sensitive more widgets?
         self.btn_login.set_sensitive(not working)
+        self.btn_next.set_sensitive(not working)
+        self.entry_passphrase.set_sensitive(not working and not self.activated)
         self.toggle_watch_cursor(working)
-        # if working:
-        #     self.spinner.start()
-        #     self.spinner.show()
-        # else:
-        #     self.spinner.stop()
-        #     self.spinner.hide()
+        self.btn_cancel.set_visible(working)
+        self.btn_cancel.set_sensitive(True)
+        self.spinner.set_visible(working)
+        self.progress = None
+        self.update_progress_label()
+        self.progress_label.set_visible(working)
+        if working:
+            self.spinner.start()
+        else:
+            self.spinner.stop()
+
+    def proceed(self):
+        # next
+        if self.moreoptions:
+            self.window.hide()
+            self.greeter.optionswindow.window.show()
+        # login
+        else:
+            self.greeter.login()
 
     def go(self):
-        self.working(True)
-        success = self.activate_persistence()
-        self.working(False)
-        if success:
-            # next
-            if self.moreoptions:
-                self.window.hide()
-                self.greeter.optionswindow.window.show()
-            # login
-            else:
-                self.greeter.login()
+        if self.activating:
+            return
+        if self.activated or not self.btn_persistence_yes.get_active():
+            self.proceed()
+        elif self.moreoptions and tailsgreeter.config.speculative_persistence_unlock:
+            # unlock while the user fills in the options window
+            self.activate_persistence(speculative=True)
+            self.proceed()
+        else:
+            self.activate_persistence()
+
+    def cb_cancel_clicked(self, widget, data=None):
+        self.greeter.persistence.cancel()
 
     def cb_login_clicked(self, widget, data=None):
         self.go()
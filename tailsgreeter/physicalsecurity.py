@@ -18,11 +18,6 @@
 """Physical security settings
 
 """
-import os
-import logging
-import pipes
-
-import tailsgreeter.config
 
 class PhysicalSecuritySettings(object):
     """Model storing settings related to physical security
@@ -32,22 +27,18 @@ class PhysicalSecuritySettings(object):
     NETCONF_DIRECT = "direct"
     NETCONF_OBSTACLE = "obstacle"
 
-    def __init__(self):
+    def __init__(self, settings):
+        self.settings = settings
         # Whether to run macspoof
         self._netconf = self.NETCONF_DIRECT
         self._macspoof = True
-        self.write_settings()
+        self.stage_settings()
 
-    def write_settings(self):
-        physical_security_settings_file = tailsgreeter.config.physical_security_settings
-        with open(physical_security_settings_file, 'w') as f:
-            os.chmod(physical_security_settings_file, 0o600)
-            f.write('TAILS_NETCONF={0}\n'.format(
-                    pipes.quote(self.netconf)))
-            f.write('TAILS_MACSPOOF_ENABLED={0}\n'.format(
-                    pipes.quote(str(self.macspoof).lower())))
-            logging.debug('physical security settings written to %s',
-                          physical_security_settings_file)
+    def stage_settings(self):
+        self.settings.stage('physical_security', [
+            ('TAILS_NETCONF', self.netconf),
+            ('TAILS_MACSPOOF_ENABLED', str(self.macspoof).lower()),
+            ])
 
     @property
     def netconf(self):
@@ -60,9 +51,9 @@ class PhysicalSecuritySettings(object):
     @netconf.setter
     def netconf(self, new_state):
         self._netconf = new_state
-        self.write_settings()
+        self.stage_settings()
 
     @macspoof.setter
     def macspoof(self, new_state):
         self._macspoof = new_state
-        self.write_settings()
+        self.stage_settings()
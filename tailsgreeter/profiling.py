@@ -0,0 +1,98 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Profiling mode
+
+When TAILS_GREETER_PROFILE is set to a directory, tails-greeter.py
+profiles itself from its first imports until the session is opened, and
+then saves in that directory:
+- tails-greeter.prof: cProfile statistics, to be loaded with pstats;
+- tails-greeter.prof.txt: the functions with the highest cumulative time;
+- tails-greeter.memory.txt: the top memory allocations if tracemalloc is
+  available (it is not in Python 2), and the peak resident set size.
+
+Only the main thread is profiled: persistence activation and other work
+done in worker threads only shows up as time spent waiting for them.
+"""
+
+import logging
+import os
+import resource
+
+import tailsgreeter.config
+
+# how many functions and allocations to list in the text reports
+TOP = 50
+
+_profiler = None
+_tracemalloc = None
+
+def enabled():
+    """Return whether profiling was requested"""
+    return bool(tailsgreeter.config.profile_dir)
+
+def start():
+    """Start profiling, if requested"""
+    global _profiler, _tracemalloc
+    if not enabled() or _profiler:
+        return
+    import cProfile
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        import tracemalloc
+    except ImportError:
+        pass
+    else:
+        tracemalloc.start()
+        _tracemalloc = tracemalloc
+
+def _write_memory_report(path):
+    with open(path, 'w') as f:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        f.write('peak resident set size: %d KiB\n' % usage.ru_maxrss)
+        if _tracemalloc is None:
+            f.write('tracemalloc is not available\n')
+            return
+        snapshot = _tracemalloc.take_snapshot()
+        _tracemalloc.stop()
+        f.write('top %d allocations:\n' % TOP)
+        for statistic in snapshot.statistics('lineno')[:TOP]:
+            f.write('%s\n' % statistic)
+
+def dump():
+    """Stop profiling and save the results, if profiling"""
+    global _profiler
+    if _profiler is None:
+        return
+    import pstats
+    profiler, _profiler = _profiler, None
+    profiler.disable()
+    directory = tailsgreeter.config.profile_dir
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        stats_path = os.path.join(directory, 'tails-greeter.prof')
+        profiler.dump_stats(stats_path)
+        with open(stats_path + '.txt', 'w') as f:
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats('cumulative').print_stats(TOP)
+        _write_memory_report(os.path.join(directory,
+                                          'tails-greeter.memory.txt'))
+        logging.info("saved profile to %s", directory)
+    except (IOError, OSError) as e:
+        logging.warning("cannot save profile to %s: %s", directory, e)
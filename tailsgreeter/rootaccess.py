@@ -20,17 +20,13 @@
 """Root access handling
 
 """
-import os
-import logging
-import pipes
-
-import tailsgreeter.config
 
 class RootAccessSettings(object):
     """Model storing settings related to root access
 
     """
-    def __init__(self):
+    def __init__(self, settings):
+        self.settings = settings
         # Root password
         self.password = None
         # XXX: this should read the content of the setting file
@@ -43,15 +39,7 @@ class RootAccessSettings(object):
     def password(self, password):
         self._password = password
         if password:
-            with open(tailsgreeter.config.rootpassword_output_path, 'w') as f:
-                os.chmod(tailsgreeter.config.rootpassword_output_path, 0o600)
-                f.write('TAILS_USER_PASSWORD=%s\n' % pipes.quote(self.password))
-                logging.debug('password written to %s',
-                              tailsgreeter.config.rootpassword_output_path)
+            variables = [('TAILS_USER_PASSWORD', password)]
         else:
-            try:
-                os.unlink(tailsgreeter.config.rootpassword_output_path)
-                logging.debug('removed %s', tailsgreeter.config.rootpassword_output_path)
-            except OSError:
-                # configuration file does not exist
-                pass
+            variables = None
+        self.settings.stage('password', variables)
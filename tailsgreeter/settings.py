@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Settings for the upcoming session
+
+The models stage their settings here instead of writing them on each
+change. At login, they are all written to a single file, that PostLogin
+sources once:
+
+    # tails-greeter settings for the upcoming session
+    TAILS_GREETER_SETTINGS_VERSION=1
+    # locale
+    TAILS_LOCALE_NAME=en_US
+    ...
+    # physical_security
+    TAILS_NETCONF=direct
+    TAILS_MACSPOOF_ENABLED=true
+
+Values are quoted for the shell. A new setting only needs a new section,
+or a new variable in an existing one; SETTINGS_VERSION must be bumped,
+together with PostLogin, when the meaning of existing variables changes.
+"""
+
+import logging
+import os
+import pipes
+import threading
+import time
+
+import tailsgreeter.config
+import tailsgreeter.utils
+from tailsgreeter.utils import unicode_to_utf8
+
+# Bump when existing variables change, see PostLogin's load_greeter_settings
+SETTINGS_VERSION = 1
+
+# Sections are written in this order, then any other in alphabetical order
+SECTIONS = ['locale', 'password', 'persistence', 'camouflage',
+            'physical_security']
+
+class SettingsStore(object):
+    """Settings staged in memory until commit()
+
+    Each section is staged as a whole, as a list of (variable, value)
+    pairs, or None for it to be left out."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = tailsgreeter.config.session_settings_path
+        self.path = path
+        # persistence is activated from a worker thread
+        self.__lock = threading.Lock()
+        self.__sections = {}
+        self.__dirty = False
+
+    def stage(self, section, variables):
+        """Stage the variables of section, or its removal if None"""
+        with self.__lock:
+            if variables is not None:
+                variables = list(variables)
+            if self.__sections.get(section) == variables:
+                return
+            if variables is None:
+                del self.__sections[section]
+            else:
+                self.__sections[section] = variables
+            self.__dirty = True
+
+    @staticmethod
+    def format(variables):
+        """Return the shell fragment setting variables to string values"""
+        return ''.join('%s=%s\n' % (name, pipes.quote(unicode_to_utf8(value)))
+                       for name, value in variables)
+
+    def dump(self):
+        """Return the content of the settings file"""
+        with self.__lock:
+            sections = dict(self.__sections)
+        names = [name for name in SECTIONS if name in sections] + \
+                sorted(name for name in sections if name not in SECTIONS)
+        content = [
+            '# tails-greeter settings for the upcoming session\n',
+            self.format([('TAILS_GREETER_SETTINGS_VERSION', str(SETTINGS_VERSION))]),
+            ]
+        for name in names:
+            content.append('# %s\n' % name)
+            content.append(self.format(sections[name]))
+        return ''.join(content)
+
+    def commit(self):
+        """Write the settings file if anything changed, and sync it to disk
+
+        The file is replaced atomically, so PostLogin sees either the
+        previous or the complete new settings."""
+        start = time.time()
+        with self.__lock:
+            dirty, self.__dirty = self.__dirty, False
+        if not dirty:
+            return
+        try:
+            tailsgreeter.utils.atomic_write(self.path, self.dump())
+            fd = os.open(os.path.dirname(self.path), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except:
+            with self.__lock:
+                self.__dirty = True
+            raise
+        logging.info('settings written to %s in %.3fs',
+                     self.path, time.time() - start)
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Startup timeline
+
+Records when each startup phase ends, on the monotonic clock, relative
+to the start of the process. The timeline is logged as a single JSON
+record once the UI is shown, so that startup regressions can be tracked
+across releases; set TAILS_GREETER_TIMELINE to a path to also save it
+there.
+
+This module must stay cheap to import: it is imported before anything
+else, to time the other imports.
+"""
+
+import json
+import logging
+import os
+import time
+
+# Bump when the structure of the emitted timeline changes
+TIMELINE_VERSION = 1
+
+CLOCK_MONOTONIC = 1
+
+def _libc_monotonic():
+    """Return a monotonic clock function based on clock_gettime(2)"""
+    import ctypes
+    import ctypes.util
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                        use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        ts = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+def _find_monotonic():
+    """Return (monotonic clock function, whether it counts since boot)"""
+    if hasattr(time, 'monotonic'):
+        return time.monotonic, True
+    try:
+        clock = _libc_monotonic()
+        clock()
+        return clock, True
+    except (OSError, AttributeError):
+        return time.time, False
+
+monotonic, _since_boot = _find_monotonic()
+
+def process_start_time():
+    """Return when this process started, on the monotonic clock
+
+    Returns None if unknown."""
+    if not _since_boot:
+        return None
+    try:
+        with open('/proc/self/stat') as f:
+            stat = f.read()
+        # the command name, in parentheses, may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        # starttime is the 22nd field, the 3rd after the command name
+        return int(fields[19]) / float(os.sysconf('SC_CLK_TCK'))
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+class Timeline(object):
+    """Monotonic timestamps of named events"""
+
+    def __init__(self):
+        self.start = process_start_time()
+        if self.start is None:
+            self.start = monotonic()
+        # (event, timestamp)
+        self.events = []
+
+    def mark(self, event):
+        """Record that event happened now"""
+        self.events.append((event, monotonic()))
+
+    def to_dict(self):
+        """Return the timeline, in milliseconds since the process started"""
+        return {
+            'version': TIMELINE_VERSION,
+            'events': [[event, round((timestamp - self.start) * 1000, 1)]
+                       for event, timestamp in self.events],
+            }
+
+    def emit(self, path=None):
+        """Log the timeline, and save it to path if given"""
+        timeline = json.dumps(self.to_dict(), sort_keys=True)
+        logging.info("startup timeline: %s", timeline)
+        if path:
+            try:
+                with open(path, 'w') as f:
+                    f.write(timeline + '\n')
+            except IOError as e:
+                logging.warning("cannot save startup timeline to %s: %s",
+                                path, e)
+
+# Timeline of the greeter startup
+startup = Timeline()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Tracing of startup and login
+
+When TAILS_GREETER_TRACE is set to a path, spans are recorded and saved
+there when the greeter exits, in the trace event format understood by
+chrome://tracing and https://ui.perfetto.dev. Timestamps are taken from
+the monotonic clock, which counts from boot, so traces of several
+processes can be lined up.
+
+    @tailsgreeter.tracing.traced('set_locale')
+    def set_locale(self, locale):
+        ...
+
+    with tailsgreeter.tracing.span('load glade file', path=path):
+        ...
+
+When tracing is disabled, traced() returns the function unchanged and
+span() does nothing.
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import thread
+import threading
+
+import tailsgreeter.config
+import tailsgreeter.timeline
+from tailsgreeter.timeline import monotonic
+
+_events = []
+# thread id: thread name, for the threads that recorded events
+_thread_names = {}
+_lock = threading.Lock()
+
+def enabled():
+    """Return whether spans are recorded"""
+    return bool(tailsgreeter.config.trace_path)
+
+def _timestamp(seconds=None):
+    # microseconds, as expected by trace viewers
+    if seconds is None:
+        seconds = monotonic()
+    return int(seconds * 1e6)
+
+def _record(event):
+    tid = thread.get_ident()
+    event['pid'] = os.getpid()
+    event['tid'] = tid
+    with _lock:
+        _events.append(event)
+        if tid not in _thread_names:
+            _thread_names[tid] = threading.current_thread().name
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Record the time spent in the with block"""
+    if not enabled():
+        yield
+        return
+    start = _timestamp()
+    try:
+        yield
+    finally:
+        _record({'name': name, 'ph': 'X', 'ts': start,
+                 'dur': _timestamp() - start, 'args': args})
+
+def instant(name, **args):
+    """Record that something happened now"""
+    if enabled():
+        _record({'name': name, 'ph': 'i', 's': 't', 'ts': _timestamp(),
+                 'args': args})
+
+def traced(name=None):
+    """Decorator recording a span for each call of the decorated function"""
+    def decorator(function):
+        if not enabled():
+            return function
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write(path=None):
+    """Save the recorded events and the startup timeline to path, by
+    default TAILS_GREETER_TRACE"""
+    if path is None:
+        path = tailsgreeter.config.trace_path
+    if not path:
+        return
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                     'tid': tid, 'args': {'name': name}}
+                    for tid, name in _thread_names.items()]
+    # the startup timeline, as process-wide instant events
+    startup = tailsgreeter.timeline.startup
+    events.extend({'name': name, 'ph': 'i', 's': 'p', 'pid': pid, 'tid': 0,
+                   'ts': _timestamp(timestamp), 'args': {}}
+                  for name, timestamp in
+                  [('process start', startup.start)] + startup.events)
+    try:
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events,
+                       'displayTimeUnit': 'ms'}, f)
+        logging.info("saved %d trace events to %s", len(events), path)
+    except IOError as e:
+        logging.warning("cannot save trace to %s: %s", path, e)
+
+if enabled():
+    atexit.register(write)
@@ -1,4 +1,117 @@
+import collections
+import logging
+import os
+import tempfile
+import threading
+
+from gi.repository import GLib
+
 def unicode_to_utf8(string):
     if isinstance(string, unicode):
         return string.encode('utf-8')
     return string
+
+class LRUCache(object):
+    """Mapping holding at most maxsize items
+
+    When full, the least recently used item is evicted."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+def atomic_write(path, content, mode=0o600):
+    """Replace the content of path atomically
+
+    The content is written and synced to a temporary file in the same
+    directory, with the right permissions from the start, which is then
+    renamed over path: readers either see the old or the new content."""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % name)
+    try:
+        # the file object owns fd from now on, and closes it on errors too
+        with os.fdopen(fd, 'w') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+def run_in_thread(function, args=(), callback=None, errback=None):
+    """Run function(*args) in a worker thread
+
+    Its result is passed to callback, or the exception it raised to
+    errback; both are called from the main loop."""
+    def deliver(handler, value):
+        handler(value)
+        return False
+
+    def run():
+        try:
+            result = function(*args)
+        except Exception as e:
+            if errback:
+                GLib.idle_add(deliver, errback, e)
+            else:
+                logging.exception('%s failed', function.__name__)
+        else:
+            if callback:
+                GLib.idle_add(deliver, callback, result)
+
+    thread = threading.Thread(target=run, name=function.__name__)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def parallel_map(function, items, max_workers):
+    """Call function(item) for each item, in up to max_workers threads
+
+    Returns a list of (result, exception) pairs, in the order of items,
+    where exception is None if function returned normally."""
+    results = [None] * len(items)
+    semaphore = threading.BoundedSemaphore(max(1, max_workers))
+
+    def run(i, item):
+        try:
+            results[i] = (function(item), None)
+        except Exception as e:
+            results[i] = (None, e)
+        finally:
+            semaphore.release()
+
+    threads = []
+    for i, item in enumerate(items):
+        semaphore.acquire()
+        thread = threading.Thread(target=run, args=(i, item))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
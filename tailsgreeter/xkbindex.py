@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Tails developers <tails@boum.org>
+#
+# This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+"""Precomputed keyboard layout index
+
+Walking the whole Xkl registry through Python callbacks is slow, so the
+layouts, their descriptions and the language to layouts mapping are
+extracted once from the xkeyboard-config rules file and saved as JSON.
+The index records which rules file it was built from, so that it is
+ignored (and rebuilt by the package trigger) when xkeyboard-config
+changes.
+
+Usage: python -m tailsgreeter.xkbindex [RULES_XML [OUTPUT]]
+"""
+
+import json
+import logging
+import os
+import sys
+import xml.etree.cElementTree as etree
+
+import tailsgreeter.config
+
+# Bump when the structure of the index changes
+INDEX_VERSION = 1
+
+def source_stamp(rules_path):
+    """Return what identifies a given version of the rules file"""
+    st = os.stat(rules_path)
+    return {
+        'path': rules_path,
+        'mtime': int(st.st_mtime),
+        'size': st.st_size,
+        }
+
+def _text(element, tag):
+    child = element.find(tag)
+    if child is None or child.text is None:
+        return ''
+    return child.text.strip()
+
+def _languages(config_item):
+    return [iso.text.strip()
+            for iso in config_item.findall('languageList/iso639Id')
+            if iso.text]
+
+def build_index(rules_path):
+    """Parse the xkeyboard-config rules file into an index
+
+    The result has the same content as what the Xkl registry walk used to
+    produce:
+    - layouts: {'fr': 'French', 'fr/bepo': 'French - French (Bepo...)', ...}
+    - languages: ISO-639 3-letter code -> list of layout codes
+    """
+    layouts = {}
+    languages = {}
+
+    def add_language(code, layout_code):
+        layout_codes = languages.setdefault(code, [])
+        if layout_code not in layout_codes:
+            layout_codes.append(layout_code)
+
+    tree = etree.parse(rules_path)
+    for layout in tree.getroot().findall('layoutList/layout'):
+        item = layout.find('configItem')
+        code = _text(item, 'name')
+        description = _text(item, 'description')
+        if code not in layouts:
+            layouts[code] = description
+        for language in _languages(item):
+            add_language(language, code)
+        for variant in layout.findall('variantList/variant'):
+            variant_item = variant.find('configItem')
+            variant_code = '%s/%s' % (code, _text(variant_item, 'name'))
+            if variant_code not in layouts:
+                layouts[variant_code] = '%s - %s' % (
+                    description, _text(variant_item, 'description'))
+            for language in _languages(variant_item):
+                add_language(language, code)
+
+    logging.debug('indexed %d layouts and %d languages from %s',
+                  len(layouts), len(languages), rules_path)
+    return {
+        'version': INDEX_VERSION,
+        'source': source_stamp(rules_path),
+        'layouts': layouts,
+        'languages': languages,
+        }
+
+def write_index(index, path):
+    """Save index to path, replacing any previous version atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, sort_keys=True)
+    os.rename(tmp_path, path)
+
+def load_index(path=None, rules_path=None):
+    """Load the index, or return None if it is missing or out of date"""
+    if path is None:
+        path = tailsgreeter.config.xkb_index_path
+    if rules_path is None:
+        rules_path = tailsgreeter.config.xkb_rules_path
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except (IOError, ValueError) as e:
+        logging.warning('cannot load keyboard layout index %s: %s', path, e)
+        return None
+    if index.get('version') != INDEX_VERSION:
+        logging.warning('keyboard layout index %s has version %s, expected %s',
+                        path, index.get('version'), INDEX_VERSION)
+        return None
+    try:
+        stamp = source_stamp(rules_path)
+    except OSError:
+        # No rules file to compare with: trust what we have
+        return index
+    if index.get('source') != stamp:
+        logging.warning('keyboard layout index %s is out of date', path)
+        return None
+    return index
+
+def main(argv):
+    rules_path = tailsgreeter.config.xkb_rules_path
+    output_path = tailsgreeter.config.xkb_index_path
+    if len(argv) > 1:
+        rules_path = argv[1]
+    if len(argv) > 2:
+        output_path = argv[2]
+    write_index(build_index(rules_path), output_path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))